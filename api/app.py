@@ -1,50 +1,204 @@
+import hmac
 import os
-from flask import Flask, send_from_directory, request, make_response
-from flask_bcrypt import Bcrypt
-from flask_jwt_extended import JWTManager
+import click
+from flask import Flask, request, make_response
 from flask_cors import CORS
 from flask_restful import Api
 from dotenv import load_dotenv
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from config import DATABASE_URL, engine_options, database_binds
 from models import db, User, Post, Comment
+from utils.search import rebuild_search_index
+from utils.facets import rebuild_facets
+from utils.cache import response_cache
+from utils.slugs import post_cache
+from utils.profiles import profile_cache
+from utils.database import configure_engine
+from utils.bulk import import_ndjson, export_ndjson, BulkImportError
+from utils.json_provider import FastJSONProvider
+from utils.auth import token_cache
+from utils.passwords import password_hasher
+from utils.jobs import job_queue
+from utils.metrics import metrics
+from utils.like_buffer import like_buffer
+from utils.rate_limit import rate_limiter, parse_limits
+from utils.static_assets import static_assets, compress_assets
 
 load_dotenv()
 
-app = Flask(__name__, static_folder="../client/dist", static_url_path="/")
-app.config["SQLALCHEMY_DATABASE_URI"] = 'sqlite:///app.db'
+# The built client is served by static_assets rather than Flask's static route.
+app = Flask(__name__, static_folder=None)
+app.json = FastJSONProvider(app)
+app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(DATABASE_URL)
+app.config["SQLALCHEMY_BINDS"] = database_binds()
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.json.compact = False
+# Used by asgi.py; derived from the database URL when unset.
+app.config["ASYNC_DATABASE_URL"] = os.environ.get("ASYNC_DATABASE_URL")
+app.config["ASGI_WSGI_WORKERS"] = int(os.environ.get("ASGI_WSGI_WORKERS", 10))
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key')
-app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'your-jwt-secret-key')
+app.config['JWT_SECRET'] = os.environ.get('JWT_SECRET', os.environ.get('JWT_SECRET_KEY', 'your-jwt-secret-key'))
+app.config['JWT_EXPIRES_SECONDS'] = int(os.environ.get('JWT_EXPIRES_SECONDS', 7 * 24 * 3600))
+app.config['BCRYPT_ROUNDS'] = int(os.environ.get('BCRYPT_ROUNDS', 12))
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+app.config['PASSWORD_HASH_QUEUE_DEPTH'] = int(os.environ.get('PASSWORD_HASH_QUEUE_DEPTH', 16))
+app.config['JOB_QUEUE_PATH'] = os.environ.get('JOB_QUEUE_PATH', 'jobs.db')
+app.config['JOB_QUEUE_EAGER'] = os.environ.get('JOB_QUEUE_EAGER', '0') == '1'
+app.config['STATS_RECONCILE_INTERVAL'] = int(os.environ.get('STATS_RECONCILE_INTERVAL', 300))
+# 'local' caches in each process and only sees that process's invalidations,
+# not those made by other workers or by `flask jobs-worker`; use 'redis' when
+# running more than one process.
+app.config['RESPONSE_CACHE_BACKEND'] = os.environ.get('RESPONSE_CACHE_BACKEND', 'local')
+app.config['RESPONSE_CACHE_REDIS_URL'] = os.environ.get('RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+app.config['RESPONSE_CACHE_TTL'] = int(os.environ.get('RESPONSE_CACHE_TTL', 60))
+app.config['POST_CACHE_SIZE'] = int(os.environ.get('POST_CACHE_SIZE', 2048))
+app.config['POST_CACHE_TTL'] = int(os.environ.get('POST_CACHE_TTL', 300))
+app.config['PROFILE_CACHE_SIZE'] = int(os.environ.get('PROFILE_CACHE_SIZE', 4096))
+app.config['PROFILE_CACHE_TTL'] = int(os.environ.get('PROFILE_CACHE_TTL', 300))
+app.config['STREAM_LISTING_THRESHOLD'] = int(os.environ.get('STREAM_LISTING_THRESHOLD', 500))
+app.config['STATIC_ROOT'] = os.environ.get('STATIC_ROOT', os.path.join(app.root_path, '..', 'client', 'dist'))
+# Hand file bodies to the front-end server (X-Sendfile) instead of streaming them.
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '0') == '1'
+# Anonymous clients are told apart by address. Behind reverse proxies every
+# request comes from the nearest proxy's address and they would all share one
+# budget, so set RATE_LIMIT_TRUST_PROXY to the number of proxies in front of
+# the app that append to X-Forwarded-For (1 for a single nginx). The client is
+# then the address the outermost of them saw; anything the client itself put
+# in the header is ignored. Too high a number lets clients pick their own key.
+# Off unless asked for.
+app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', '0') == '1'
+app.config['RATE_LIMITS'] = parse_limits(os.environ.get('RATE_LIMITS', ''))
+app.config['RATE_LIMIT_TRUST_PROXY'] = int(os.environ.get('RATE_LIMIT_TRUST_PROXY', 0))
+app.config['RATE_LIMIT_MAX_CLIENTS'] = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', 100000))
+# Buffered toggles are per process: with several workers, a like taken by one
+# and an unlike by another are flushed independently and the unlike can be
+# lost. Only enable it when a single process serves the like route.
+app.config['LIKE_BUFFER_ENABLED'] = os.environ.get('LIKE_BUFFER_ENABLED', '0') == '1'
+app.config['LIKE_FLUSH_INTERVAL_MS'] = int(os.environ.get('LIKE_FLUSH_INTERVAL_MS', 50))
+app.config['LIKE_FLUSH_MAX_EVENTS'] = int(os.environ.get('LIKE_FLUSH_MAX_EVENTS', 500))
+# Each process appends to its own files here; keep it on local disk.
+app.config['LIKE_LOG_DIR'] = os.environ.get('LIKE_LOG_DIR', 'like-log')
+app.config['LIKE_LOG_FSYNC'] = os.environ.get('LIKE_LOG_FSYNC', '0') == '1'
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+# /api/metrics and /api/metrics/slow-queries answer 404 until this is set, and
+# then only to requests bearing it.
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['METRICS_SLOW_QUERY_MS'] = float(os.environ.get('METRICS_SLOW_QUERY_MS', 100))
+app.config['METRICS_PROFILE_RATE'] = float(os.environ.get('METRICS_PROFILE_RATE', 0))
+app.config['METRICS_PROFILE_THRESHOLD_MS'] = float(os.environ.get('METRICS_PROFILE_THRESHOLD_MS', 500))
+app.config['METRICS_PROFILE_DIR'] = os.environ.get('METRICS_PROFILE_DIR', 'profiles')
 
 migrate = Migrate(app, db, render_as_batch=True)
 
-bcrypt = Bcrypt(app)
-jwt = JWTManager(app)
+
+@app.cli.command("import-content")
+@click.argument("kind", type=click.Choice(["posts", "comments"]))
+@click.argument("source", type=click.File("rb"), default="-")
+@click.option("--batch-size", default=1000, show_default=True)
+def import_content(kind, source, batch_size):
+    """Bulk insert posts or comments from NDJSON."""
+    try:
+        inserted, skipped = import_ndjson(kind, source, batch_size)
+    except BulkImportError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Imported {inserted} {kind}, skipped {skipped}")
+
+
+@app.cli.command("jobs-worker")
+@click.option("--batch-size", default=10, show_default=True)
+@click.option("--poll-interval", default=1.0, show_default=True)
+def jobs_worker(batch_size, poll_interval):
+    """Run queued background jobs until interrupted."""
+    import utils.tasks  # registers the job handlers
+    if app.config["RESPONSE_CACHE_BACKEND"] == "local" and not job_queue.eager:
+        click.echo("Warning: with RESPONSE_CACHE_BACKEND=local the web workers do not see this worker's cache "
+                   "invalidations; their listings stay stale for up to RESPONSE_CACHE_TTL seconds after each job.", err=True)
+    click.echo(f"Working on {job_queue.path}")
+    # A fresh session per job, so one failed job cannot poison the next.
+    job_queue.work(poll_interval=poll_interval, limit=batch_size, after_job=db.session.remove)
+
+
+@app.cli.command("compress-assets")
+@click.option("--min-size", default=1024, show_default=True)
+def compress_static_assets(min_size):
+    """Write gzip and brotli variants of the built client assets."""
+    written = compress_assets(app.config["STATIC_ROOT"], min_size)
+    click.echo(f"Wrote {written} compressed files")
+
+
+@app.cli.command("export-content")
+@click.argument("kind", type=click.Choice(["posts", "comments"]))
+@click.argument("target", type=click.File("w"), default="-")
+def export_content(kind, target):
+    """Stream posts or comments out as NDJSON."""
+    for line in export_ndjson(kind):
+        target.write(line)
+
+
+password_hasher.init_app(app)
+job_queue.init_app(app)
+token_cache.max_entries = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 4096))
 db.init_app(app)
+response_cache.init_app(app)
+post_cache.init_app(app)
+profile_cache.init_app(app)
+like_buffer.init_app(app)
+metrics.init_app(app)
+# After metrics, so requests turned away still show up in its counts.
+rate_limiter.init_app(app)
+static_assets.init_app(app)
+
+with app.app_context():
+    for engine in db.engines.values():
+        configure_engine(engine)
+        metrics.instrument_engine(engine)
 
 CORS(app)
 
-from routes.user_route import user_routes
-from routes.auth_route import auth_routes
-from routes.post_route import post_routes
-from routes.comment_route import comment_routes
+from controllers.user_controller import user_routes
+from controllers.auth_controller import auth_bp
+from controllers.post_controller import post_routes
+from controllers.comment_controller import comment_routes
 
 app.register_blueprint(user_routes, url_prefix="/api/user")
-app.register_blueprint(auth_routes, url_prefix="/api/auth")
+app.register_blueprint(auth_bp, url_prefix="/api/auth")
 app.register_blueprint(post_routes, url_prefix="/api/post")
 app.register_blueprint(comment_routes, url_prefix="/api/comment")
 
 
+def metrics_denied():
+    # The error response for a metrics request, or None to serve it. Without
+    # a token configured the routes do not exist.
+    token = app.config["METRICS_TOKEN"]
+    if not token:
+        return {"success": False, "statusCode": 404, "message": "Not Found"}, 404
+    if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+        return {"success": False, "statusCode": 401, "message": "Unauthorized"}, 401
+    return None
+
+
+@app.route("/api/metrics", methods=["GET"])
+def metrics_endpoint():
+    denied = metrics_denied()
+    if denied:
+        return denied
+    return app.response_class(metrics.render() + rate_limiter.render() + profile_cache.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/api/metrics/slow-queries", methods=["GET"])
+def slow_queries_endpoint():
+    denied = metrics_denied()
+    if denied:
+        return denied
+    return {"slowQueries": list(metrics.slow_queries)}
+
+
 @app.route("/", defaults={"path": ""})
 @app.route("/<path:path>")
 def serve(path):
-    if path != "" and os.path.exists(app.static_folder + "/" + path):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.static_folder, "index.html")
+    return static_assets.serve(path)
 
 
 @app.errorhandler(Exception)
@@ -58,5 +212,29 @@ def handle_exception(e):
     }, status_code
 
 
+@app.cli.command("reindex-posts")
+def reindex_posts():
+    """Rebuild the full-text search index over posts."""
+    if rebuild_search_index():
+        click.echo("Post search index rebuilt")
+    else:
+        click.echo("Full-text search is not available for this database")
+
+
+@app.cli.command("flush-likes")
+def flush_likes():
+    """Write out like log segments left behind by stopped processes."""
+    replayed = like_buffer.recover()
+    click.echo(f"Replayed {replayed} likes")
+
+
+@app.cli.command("rebuild-facets")
+def rebuild_post_facets():
+    """Recount the per-category and per-author post facets."""
+    rebuild_facets()
+    response_cache.invalidate("posts")
+    click.echo("Post facet counts rebuilt")
+
+
 if __name__ == "__main__":
     app.run(port=3000, debug=True)
@@ -0,0 +1,7 @@
+# Optional ASGI entry point, e.g. `uvicorn asgi:application --workers 4`.
+# The hot read paths run as async handlers; everything else is served by the
+# Flask app on a thread pool.
+from app import app
+from utils.asgi import AsyncReadApp
+
+application = AsyncReadApp(app)
@@ -0,0 +1,38 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///app.db')
+# Optional read replica; GET requests are routed to it when set.
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+
+def engine_options(url):
+    if url.startswith('sqlite'):
+        options = {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000}}
+        if url in ('sqlite://', 'sqlite:///:memory:'):
+            # In-memory databases live and die with their one connection.
+            return options
+    else:
+        options = {'pool_pre_ping': True}
+
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    return options
+
+
+def database_binds():
+    if not DATABASE_REPLICA_URL:
+        return {}
+    return {'replica': {'url': DATABASE_REPLICA_URL, **engine_options(DATABASE_REPLICA_URL)}}
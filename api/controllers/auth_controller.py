@@ -1,9 +1,11 @@
 from flask import Blueprint, request, jsonify, make_response
-from models import User
-import bcrypt
-import jwt
+from models import User, db
+from sqlalchemy.exc import IntegrityError
 import os
 from utils import error_handler
+from utils.auth import issue_token, TOKEN_COOKIE
+from utils.passwords import password_hasher
+from utils.serializers import user_schema
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -18,13 +20,16 @@ def signup():
         return error_handler(400, 'All fields are required')
 
     # Check if user with the same email already exists
-    if User.objects.filter(email=email).count() > 0:
+    if db.session.scalar(db.select(User.id).where(User.email == email)) is not None:
         return error_handler(400, 'User with this email already exists')
 
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-
-    new_user = User(username=username, email=email, password=hashed_password)
-    new_user.save()
+    new_user = User(username=username, email=email, password=password)
+    db.session.add(new_user)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return error_handler(400, 'User with this email or username already exists')
 
     return jsonify({'message': 'Signup successful'}), 200
 
@@ -37,18 +42,22 @@ def signin():
     if not email or not password:
         return error_handler(400, 'All fields are required')
 
-    try:
-        user = User.objects.get(email=email)
-    except User.DoesNotExist:
+    user = db.session.scalar(db.select(User).where(User.email == email))
+    if user is None:
         return error_handler(404, 'User not found')
 
-    if not bcrypt.checkpw(password.encode('utf-8'), user.password):
+    if not user.verify_password(password):
         return error_handler(400, 'Invalid password')
 
-    token = jwt.encode({'id': str(user.id), 'isAdmin': user.isAdmin}, os.environ.get('JWT_SECRET'), algorithm='HS256')
+    # Upgrade hashes made with an older algorithm or cost while we have the password.
+    if password_hasher.needs_rehash(user.password_hash):
+        user.password = password
+        db.session.commit()
+
+    token = issue_token(user)
 
-    response = make_response(jsonify({'id': str(user.id), 'username': user.username, 'email': user.email, 'isAdmin': user.isAdmin}))
-    response.set_cookie('access_token', token, httponly=True)
+    response = make_response(jsonify(user_schema.dump(user)))
+    response.set_cookie(TOKEN_COOKIE, token, httponly=True)
 
     return response
 
@@ -59,18 +68,29 @@ def google():
     name = data.get('name')
     google_photo_url = data.get('googlePhotoUrl')
 
-    try:
-        user = User.objects.get(email=email)
-    except User.DoesNotExist:
-        generated_password = bcrypt.hashpw(os.urandom(16), bcrypt.gensalt())
-        username = name.lower().replace(' ', '') + str(os.urandom(4))
-        new_user = User(username=username, email=email, password=generated_password, profilePicture=google_photo_url)
-        new_user.save()
-        user = new_user
-
-    token = jwt.encode({'id': str(user.id), 'isAdmin': user.isAdmin}, os.environ.get('JWT_SECRET'), algorithm='HS256')
-
-    response = make_response(jsonify({'id': str(user.id), 'username': user.username, 'email': user.email, 'isAdmin': user.isAdmin, 'profilePicture': user.profilePicture}))
-    response.set_cookie('access_token', token, httponly=True)
+    if not email or not name:
+        return error_handler(400, 'All fields are required')
+
+    user = db.session.scalar(db.select(User).where(User.email == email))
+    if user is None:
+        generated_password = os.urandom(16).hex()
+        username = name.lower().replace(' ', '') + os.urandom(4).hex()
+        user = User(username=username, email=email, password=generated_password)
+        if google_photo_url:
+            user.profile_picture = google_photo_url
+        db.session.add(user)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Signed up by a concurrent request for the same account.
+            db.session.rollback()
+            user = db.session.scalar(db.select(User).where(User.email == email))
+            if user is None:
+                return error_handler(400, 'Could not create the account')
+
+    token = issue_token(user)
+
+    response = make_response(jsonify(user_schema.dump(user)))
+    response.set_cookie(TOKEN_COOKIE, token, httponly=True)
 
     return response
@@ -1,120 +1,274 @@
-from flask import Blueprint, request, jsonify
-from models import Comment, db
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt_claims
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
+from models import Comment, CommentLike, db
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
 from utils import error_handler
+from utils.auth import auth_required, current_user_id, is_admin
+from utils.pagination import keyset_statement, finish_keyset_page, InvalidCursor
+from utils.stats import stats
+from utils.serializers import comment_schema
+from utils.cache import response_cache
+from utils.bulk import import_ndjson, export_ndjson, BulkImportError
+from utils.streaming import stream_listing, STREAM_BATCH_SIZE
+from utils.threads import (
+    thread_page, replies_page, branch, reply_path, InvalidParent,
+    THREAD_PAGE_SIZE, REPLIES_PER_THREAD, MAX_REPLIES_PER_THREAD, BRANCH_LIMIT,
+)
+from utils.tasks import delete_comment_branch
+from utils.ranking import add_post_engagement, add_comment_likes, COMMENT_SORTS
+from utils.like_buffer import like_buffer
 
 comment_routes = Blueprint('comment_routes', __name__)
 
+COMMENT_PAGE_SIZE = 20
+
 @comment_routes.route('/create', methods=['POST'])
-@jwt_required()
+@auth_required
 def create_comment():
     try:
         content = request.json.get('content')
         post_id = request.json.get('postId')
-        user_id = get_jwt_identity()
+        user_id = current_user_id()
 
         if not content or not post_id:
             return error_handler(400, 'Please provide all required fields')
 
-        new_comment = Comment(content=content, post_id=post_id, user_id=user_id)
+        parent_id, path = reply_path(int(post_id), request.json.get('parentId'))
+        new_comment = Comment(content=content, post_id=post_id, user_id=user_id, parent_id=parent_id, path=path)
         db.session.add(new_comment)
+        add_post_engagement(post_id, 1)
         db.session.commit()
+        response_cache.invalidate('comments', 'posts')
 
-        return jsonify(new_comment.to_dict()), 200
+        return jsonify(comment_schema.dump(new_comment)), 200
+    except InvalidParent as e:
+        return error_handler(400, str(e))
     except Exception as e:
         return error_handler(500, str(e))
 
+def post_comments_listing(post_id, args):
+    # The statement behind getPostComments and a function turning its rows
+    # into the response body, shared with the async read path. Without
+    # ?sort= every comment is returned, newest first; ?sort=top|hot returns
+    # keyset pages of them in ranked order.
+    if args.get('sort') not in COMMENT_SORTS:
+        query = comment_schema.select().filter_by(post_id=post_id)
+        return query.order_by(Comment.created_at.desc()), comment_schema.dump_rows
+
+    sort_key = COMMENT_SORTS[args.get('sort')]
+    sort_column = getattr(Comment, sort_key)
+    query = comment_schema.select(sort_column).filter_by(post_id=post_id)
+    limit = min(int(args.get('limit', COMMENT_PAGE_SIZE)), 100)
+    page = keyset_statement(query, sort_key, sort_column, Comment.id, True, args.get('cursor'), limit)
+
+    def finish(rows):
+        comments, next_cursor = finish_keyset_page(rows, sort_key, sort_column, limit)
+        return {'comments': comment_schema.dump_rows(comments), 'nextCursor': next_cursor}
+    return page, finish
+
 @comment_routes.route('/getPostComments/<int:post_id>', methods=['GET'])
+@response_cache.cached('comments')
 def get_post_comments(post_id):
     try:
-        comments = Comment.query.filter_by(post_id=post_id).order_by(Comment.created_at.desc()).all()
-        return jsonify([comment.to_dict() for comment in comments]), 200
+        statement, finish = post_comments_listing(post_id, request.args)
+        return jsonify(finish(db.session.execute(statement).all())), 200
+    except InvalidCursor as e:
+        return error_handler(400, str(e))
+    except Exception as e:
+        return error_handler(500, str(e))
+
+@comment_routes.route('/getPostThreads/<int:post_id>', methods=['GET'])
+@response_cache.cached('comments')
+def get_post_threads(post_id):
+    try:
+        limit = min(int(request.args.get('limit', THREAD_PAGE_SIZE)), 100)
+        replies = min(int(request.args.get('replies', REPLIES_PER_THREAD)), MAX_REPLIES_PER_THREAD)
+        comments, next_cursor = thread_page(post_id, request.args.get('cursor'), limit, replies)
+        return jsonify({'comments': comments, 'nextCursor': next_cursor}), 200
+    except InvalidCursor as e:
+        return error_handler(400, str(e))
     except Exception as e:
         return error_handler(500, str(e))
 
+@comment_routes.route('/getReplies/<int:comment_id>', methods=['GET'])
+@response_cache.cached('comments')
+def get_replies(comment_id):
+    try:
+        comment = db.session.get(Comment, comment_id)
+        if not comment:
+            return error_handler(404, 'Comment not found')
+
+        if request.args.get('branch'):
+            limit = min(int(request.args.get('limit', BRANCH_LIMIT)), 1000)
+            replies, truncated = branch(comment, limit)
+            return jsonify({'replies': replies, 'truncated': truncated}), 200
+
+        limit = min(int(request.args.get('limit', THREAD_PAGE_SIZE)), 100)
+        replies, next_cursor = replies_page(comment, request.args.get('cursor'), limit)
+        return jsonify({'replies': replies, 'nextCursor': next_cursor}), 200
+    except InvalidCursor as e:
+        return error_handler(400, str(e))
+    except Exception as e:
+        return error_handler(500, str(e))
+
+def toggle_like(comment_id, user_id):
+    # Unlike if a like row exists, otherwise like. The (comment_id, user_id)
+    # primary key turns a concurrent duplicate like into an IntegrityError, and
+    # number_of_likes is adjusted in SQL rather than read-modify-written. The
+    # comment and its post are rescored in the same transaction.
+    removed = db.session.execute(
+        db.delete(CommentLike).where(CommentLike.comment_id == comment_id, CommentLike.user_id == user_id)
+    ).rowcount
+    if removed:
+        delta = -1
+    else:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(CommentLike).values(comment_id=comment_id, user_id=user_id))
+            delta = 1
+        except IntegrityError:
+            delta = 0
+
+    if delta:
+        add_comment_likes(comment_id, delta)
+    db.session.commit()
+    response_cache.invalidate('comments', 'posts')
+    return delta
+
 @comment_routes.route('/likeComment/<int:comment_id>', methods=['PUT'])
-@jwt_required()
+@auth_required
 def like_comment(comment_id):
     try:
         comment = Comment.query.get(comment_id)
         if not comment:
             return error_handler(404, 'Comment not found')
 
-        user_id = get_jwt_identity()
-        if user_id in comment.likes:
-            comment.number_of_likes -= 1
-            comment.likes.remove(user_id)
-        else:
-            comment.number_of_likes += 1
-            comment.likes.append(user_id)
+        user_id = current_user_id()
+        if not like_buffer.enabled:
+            toggle_like(comment_id, user_id)
+            db.session.refresh(comment)
+            return jsonify(comment_schema.dump(comment)), 200
 
-        db.session.commit()
-        return jsonify(comment.to_dict()), 200
+        # Written out by the next flush; the response already shows the
+        # toggle, and any others not flushed yet, to the user who made it.
+        liked = like_buffer.toggle(comment_id, user_id)
+        response_cache.invalidate('comments')
+        data = comment_schema.dump(comment)
+        likes = like_buffer.overlay(comment_id, data['likes'])
+        (likes.add if liked else likes.discard)(user_id)
+        data['numberOfLikes'] = (data['numberOfLikes'] or 0) + len(likes) - len(data['likes'])
+        data['likes'] = sorted(likes)
+        return jsonify(data), 200
     except Exception as e:
         return error_handler(500, str(e))
 
 @comment_routes.route('/editComment/<int:comment_id>', methods=['PUT'])
-@jwt_required()
+@auth_required
 def edit_comment(comment_id):
     try:
         comment = Comment.query.get(comment_id)
         if not comment:
             return error_handler(404, 'Comment not found')
 
-        user_id = get_jwt_identity()
-        claims = get_jwt_claims()
-        if comment.user_id != user_id and not claims.get('isAdmin', False):
+        user_id = current_user_id()
+        if comment.user_id != user_id and not is_admin():
             return error_handler(403, 'You are not allowed to edit this comment')
 
         comment.content = request.json.get('content')
         db.session.commit()
-        return jsonify(comment.to_dict()), 200
+        response_cache.invalidate('comments')
+        return jsonify(comment_schema.dump(comment)), 200
     except Exception as e:
         return error_handler(500, str(e))
 
 @comment_routes.route('/deleteComment/<int:comment_id>', methods=['DELETE'])
-@jwt_required()
+@auth_required
 def delete_comment(comment_id):
     try:
         comment = Comment.query.get(comment_id)
         if not comment:
             return error_handler(404, 'Comment not found')
 
-        user_id = get_jwt_identity()
-        claims = get_jwt_claims()
-        if comment.user_id != user_id and not claims.get('isAdmin', False):
+        user_id = current_user_id()
+        if comment.user_id != user_id and not is_admin():
             return error_handler(403, 'You are not allowed to delete this comment')
 
+        has_replies = db.session.scalar(db.select(Comment.id).where(Comment.parent_id == comment.id).limit(1))
+        post_id, prefix = comment.post_id, comment.branch_path
         db.session.delete(comment)
+        # Replies are recounted when their branch is deleted.
+        add_post_engagement(post_id, -1 - (comment.number_of_likes or 0))
         db.session.commit()
+        response_cache.invalidate('comments', 'posts')
+        if has_replies:
+            delete_comment_branch.enqueue(post_id=post_id, prefix=prefix, idempotency_key=f'delete_comment_branch:{comment_id}')
         return jsonify({'message': 'Comment has been deleted'}), 200
     except Exception as e:
         return error_handler(500, str(e))
 
 @comment_routes.route('/getcomments', methods=['GET'])
-@jwt_required()
+@auth_required
 def get_comments():
     try:
-        claims = get_jwt_claims()
-        if not claims.get('isAdmin', False):
+        if not is_admin():
             return error_handler(403, 'You are not allowed to get all comments')
 
         start_index = int(request.args.get('startIndex', 0))
         limit = int(request.args.get('limit', 9))
         sort_direction = -1 if request.args.get('sort') == 'desc' else 1
 
-        comments = Comment.query.order_by(Comment.created_at.desc() if sort_direction == -1 else Comment.created_at.asc()).slice(start_index, start_index + limit).all()
-        total_comments = Comment.query.count()
+        query = comment_schema.select()
+        cursor = request.args.get('cursor')
+        next_cursor = None
+        stream = cursor is None and limit >= current_app.config.get('STREAM_LISTING_THRESHOLD', 500)
+        if cursor is not None:
+            page = keyset_statement(query, 'created_at', Comment.created_at, Comment.id, sort_direction == -1, cursor, limit)
+            comments, next_cursor = finish_keyset_page(db.session.execute(page).all(), 'created_at', Comment.created_at, limit)
+        else:
+            page = query.order_by(Comment.created_at.desc() if sort_direction == -1 else Comment.created_at.asc()).slice(start_index, start_index + limit)
+            if stream:
+                comments = db.session.execute(page.execution_options(yield_per=STREAM_BATCH_SIZE))
+            else:
+                comments = db.session.execute(page).all()
+        total_comments = stats.total(Comment)
 
         now = datetime.utcnow()
         one_month_ago = now - timedelta(days=30)
-        last_month_comments = Comment.query.filter(Comment.created_at >= one_month_ago).count()
+        last_month_comments = stats.last_month(Comment, one_month_ago)
+
+        if stream:
+            return stream_listing('comments', comments, comment_schema.dump_row,
+                                  totalComments=total_comments, lastMonthComments=last_month_comments, nextCursor=None)
 
         return jsonify({
-            'comments': [comment.to_dict() for comment in comments],
+            'comments': comment_schema.dump_rows(comments),
             'totalComments': total_comments,
-            'lastMonthComments': last_month_comments
+            'lastMonthComments': last_month_comments,
+            'nextCursor': next_cursor
         }), 200
+    except InvalidCursor as e:
+        return error_handler(400, str(e))
     except Exception as e:
         return error_handler(500, str(e))
+
+@comment_routes.route('/import', methods=['POST'])
+@auth_required
+def import_comments():
+    try:
+        if not is_admin():
+            return error_handler(403, 'You are not allowed to import comments')
+
+        inserted, skipped = import_ndjson('comments', request.stream)
+        return jsonify({'inserted': inserted, 'skipped': skipped}), 200
+    except BulkImportError as e:
+        return error_handler(400, str(e))
+    except Exception as e:
+        return error_handler(500, str(e))
+
+@comment_routes.route('/export', methods=['GET'])
+@auth_required
+def export_comments():
+    if not is_admin():
+        return error_handler(403, 'You are not allowed to export comments')
+
+    return Response(stream_with_context(export_ndjson('comments')), mimetype='application/x-ndjson')
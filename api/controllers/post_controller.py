@@ -1,101 +1,241 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from models import Post, db
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt_claims
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
 from utils import error_handler
+from utils.auth import auth_required, current_user_id, is_admin
+from utils.search import search_posts
+from utils.pagination import keyset_statement, finish_keyset_page, InvalidQuery
+from utils.stats import stats
+from utils.serializers import post_schema
+from utils.cache import response_cache, CACHE_CONTROL
+from utils.slugs import unique_slugs, post_cache
+from utils.facets import facet_counts, adjust_facets
+from utils.bulk import import_ndjson, export_ndjson, BulkImportError
+from utils.tasks import delete_post_comments
+from utils.ranking import POST_SORTS
 
 post_routes = Blueprint('post_routes', __name__, url_prefix='/api/post')
 
+POST_SORT_KEYS = ('created_at', 'updated_at', 'title')
+MAX_POSTS_PAGE_SIZE = 100
+
 @post_routes.route('/create', methods=['POST'])
-@jwt_required()
+@auth_required
 def create_post():
     try:
         title = request.json.get('title')
         content = request.json.get('content')
-        category = request.json.get('category', 'uncategorized')
+        # A missing or null category is stored as the column default, and
+        # has to be counted under it too.
+        category = request.json.get('category') or Post.category.default.arg
         image = request.json.get('image', 'https://www.hostinger.com/tutorials/wp-content/uploads/sites/2/2021/09/how-to-write-a-blog-post.png')
-        user_id = get_jwt_identity()
+        user_id = current_user_id()
 
         if not title or not content:
             return error_handler(400, 'Please provide all required fields')
 
-        new_post = Post(title=title, content=content, category=category, image=image, user_id=user_id)
-        db.session.add(new_post)
-        db.session.commit()
-
-        return jsonify(new_post.to_dict()), 201
+        # A concurrent post can take the slug between choosing and inserting
+        # it; that is retried once with a fresh one.
+        for attempt in range(2):
+            slug = unique_slugs([title])[0]
+            new_post = Post(title=title, content=content, category=category, image=image, user_id=user_id, slug=slug)
+            try:
+                db.session.add(new_post)
+                adjust_facets([(category, user_id, 1)])
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if db.session.scalar(db.select(Post.id).where(Post.title == title)) is not None:
+                    return error_handler(400, 'A post with this title already exists')
+        else:
+            return error_handler(409, 'Could not pick a unique slug for this post, please try again')
+        response_cache.invalidate('posts')
+
+        return jsonify(post_schema.dump(new_post)), 201
     except Exception as e:
         return error_handler(500, str(e))
 
+def posts_listing(args):
+    # The statements behind one getposts page, shared with the async read
+    # path: the page itself, a count for filtered listings (None means use
+    # the stats totals), and a function turning the page rows into
+    # (posts, next_cursor).
+    try:
+        start_index = max(int(args.get('startIndex', 0)), 0)
+        limit = min(max(int(args.get('limit', 9)), 1), MAX_POSTS_PAGE_SIZE)
+    except ValueError:
+        raise InvalidQuery('startIndex and limit must be integers')
+    sort_direction = 'desc' if args.get('order') == 'desc' else 'asc'
+    ranked = args.get('sort') in POST_SORTS
+    sort_key = args.get('sortBy', 'created_at')
+    if sort_key not in POST_SORT_KEYS:
+        raise InvalidQuery(f"sortBy must be one of {', '.join(POST_SORT_KEYS)}")
+    if ranked:
+        sort_key, sort_direction = POST_SORTS[args.get('sort')], 'desc'
+    sort_column = getattr(Post, sort_key)
+
+    query = post_schema.select(sort_column)
+    if args.get('userId'):
+        query = query.filter_by(user_id=args.get('userId'))
+    if args.get('category'):
+        query = query.filter_by(category=args.get('category'))
+    if args.get('postId'):
+        query = query.filter_by(id=args.get('postId'))
+    if args.get('slug'):
+        query = query.filter_by(slug=args.get('slug'))
+    rank = None
+    if args.get('searchTerm'):
+        query, rank = search_posts(query, args.get('searchTerm'))
+
+    filtered = any(args.get(key) for key in ('userId', 'category', 'postId', 'slug', 'searchTerm'))
+    count = db.select(db.func.count()).select_from(query.subquery()) if filtered else None
+
+    cursor = args.get('cursor')
+    if cursor is not None:
+        page = keyset_statement(query, sort_key, sort_column, Post.id, sort_direction == 'desc', cursor, limit)
+        return page, count, lambda rows: finish_keyset_page(rows, sort_key, sort_column, limit)
+
+    if rank is not None and not args.get('sortBy') and not ranked:
+        order_by = rank.asc()
+    else:
+        order_by = sort_column.desc() if sort_direction == 'desc' else sort_column.asc()
+    page = query.order_by(order_by).slice(start_index, start_index + limit)
+    return page, count, lambda rows: (rows, None)
+
 @post_routes.route('/getposts', methods=['GET'])
+@response_cache.cached('posts')
 def get_posts():
     try:
-        start_index = int(request.args.get('startIndex', 0))
-        limit = int(request.args.get('limit', 9))
-        sort_direction = 'desc' if request.args.get('order') == 'desc' else 'asc'
-
-        query = Post.query
-        if request.args.get('userId'):
-            query = query.filter_by(user_id=request.args.get('userId'))
-        if request.args.get('category'):
-            query = query.filter_by(category=request.args.get('category'))
-        if request.args.get('postId'):
-            query = query.filter_by(id=request.args.get('postId'))
-        if request.args.get('searchTerm'):
-            search_term = request.args.get('searchTerm')
-            query = query.filter(Post.title.ilike(f'%{search_term}%') | Post.content.ilike(f'%{search_term}%'))
-
-        posts = query.order_by(getattr(Post, request.args.get('sortBy', 'created_at')).desc() if sort_direction == 'desc' else getattr(Post, request.args.get('sortBy', 'created_at')).asc()).slice(start_index, start_index + limit).all()
-        total_posts = query.count()
+        page, count, finish = posts_listing(request.args)
+        posts, next_cursor = finish(db.session.execute(page).all())
+        total_posts = db.session.scalar(count) if count is not None else stats.total(Post)
 
         now = datetime.utcnow()
         one_month_ago = now - timedelta(days=30)
-        last_month_posts = Post.query.filter(Post.created_at >= one_month_ago).count()
+        last_month_posts = stats.last_month(Post, one_month_ago)
 
         return jsonify({
-            'posts': [post.to_dict() for post in posts],
+            'posts': post_schema.dump_rows(posts),
             'totalPosts': total_posts,
-            'lastMonthPosts': last_month_posts
+            'lastMonthPosts': last_month_posts,
+            'nextCursor': next_cursor
+        }), 200
+    except InvalidQuery as e:
+        return error_handler(400, str(e))
+    except Exception as e:
+        return error_handler(500, str(e))
+
+def post_body(slug):
+    # The JSON body and ETag of the post with this slug, or None. Shared
+    # with the async read path.
+    entry = post_cache.get(slug)
+    if entry is not None:
+        return entry
+    generation = post_cache.generation
+    post = db.session.execute(post_schema.select().filter_by(slug=slug)).first()
+    if post is None:
+        return None
+    return post_cache.set(slug, (current_app.json.dumps(post_schema.dump_row(post)) + '\n').encode('utf-8'), generation)
+
+@post_routes.route('/getpost/<slug>', methods=['GET'])
+def get_post(slug):
+    try:
+        entry = post_body(slug)
+        if entry is None:
+            return error_handler(404, 'Post not found')
+        body, etag = entry
+        response = current_app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        return response.make_conditional(request)
+    except Exception as e:
+        return error_handler(500, str(e))
+
+@post_routes.route('/facets', methods=['GET'])
+@response_cache.cached('posts')
+def get_facets():
+    try:
+        categories, authors, total = facet_counts(request.args)
+        return jsonify({
+            'categories': categories,
+            'authors': authors,
+            'totalPosts': stats.total(Post) if total is None else total,
         }), 200
     except Exception as e:
         return error_handler(500, str(e))
 
 @post_routes.route('/deletepost/<post_id>', methods=['DELETE'])
-@jwt_required()
+@auth_required
 def delete_post(post_id):
     try:
         post = Post.query.get(post_id)
         if not post:
             return error_handler(404, 'Post not found')
 
-        user_id = get_jwt_identity()
-        if post.user_id != user_id and not get_jwt_claims()['isAdmin']:
+        user_id = current_user_id()
+        if post.user_id != user_id and not is_admin():
             return error_handler(403, 'You are not allowed to delete this post')
 
-        db.session.delete(post)
+        # Delete just the post row here; its comments are removed in batches
+        # by a background job so the request cost does not grow with them.
+        db.session.execute(db.delete(Post).where(Post.id == post.id))
+        adjust_facets([(post.category, post.user_id, -1)])
         db.session.commit()
+        stats.apply([(Post, post.created_at, -1)])
+        response_cache.invalidate('posts')
+        post_cache.invalidate(post.slug)
+        delete_post_comments.enqueue(post_id=post.id, idempotency_key=f'delete_post_comments:{post.id}')
         return jsonify({'message': 'The post has been deleted'}), 200
     except Exception as e:
         return error_handler(500, str(e))
 
 @post_routes.route('/updatepost/<post_id>', methods=['PUT'])
-@jwt_required()
+@auth_required
 def update_post(post_id):
     try:
         post = Post.query.get(post_id)
         if not post:
             return error_handler(404, 'Post not found')
 
-        user_id = get_jwt_identity()
-        if post.user_id != user_id and not get_jwt_claims()['isAdmin']:
+        user_id = current_user_id()
+        if post.user_id != user_id and not is_admin():
             return error_handler(403, 'You are not allowed to update this post')
 
+        previous_category = post.category
         post.title = request.json.get('title', post.title)
         post.content = request.json.get('content', post.content)
-        post.category = request.json.get('category', post.category)
+        post.category = request.json.get('category', post.category) or Post.category.default.arg
         post.image = request.json.get('image', post.image)
+        if post.category != previous_category:
+            adjust_facets([(previous_category, post.user_id, -1), (post.category, post.user_id, 1)])
 
         db.session.commit()
-        return jsonify(post.to_dict()), 200
+        response_cache.invalidate('posts')
+        post_cache.invalidate(post.slug)
+        return jsonify(post_schema.dump(post)), 200
+    except Exception as e:
+        return error_handler(500, str(e))
+
+@post_routes.route('/import', methods=['POST'])
+@auth_required
+def import_posts():
+    try:
+        if not is_admin():
+            return error_handler(403, 'You are not allowed to import posts')
+
+        inserted, skipped = import_ndjson('posts', request.stream)
+        return jsonify({'inserted': inserted, 'skipped': skipped}), 200
+    except BulkImportError as e:
+        return error_handler(400, str(e))
     except Exception as e:
-        return error_handler(500, str(e))
\ No newline at end of file
+        return error_handler(500, str(e))
+
+@post_routes.route('/export', methods=['GET'])
+@auth_required
+def export_posts():
+    if not is_admin():
+        return error_handler(403, 'You are not allowed to export posts')
+
+    return Response(stream_with_context(export_ndjson('posts')), mimetype='application/x-ndjson')
@@ -1,24 +1,34 @@
-import bcrypt
-from flask import jsonify, request
-from models import User
+from flask import Blueprint, jsonify, request, current_app
+from models import db, User
 from utils.error import error_handler
-from app import app, db
-
-@app.route('/api/test', methods=['GET'])
+from utils.pagination import keyset_statement, finish_keyset_page, InvalidCursor
+from utils.stats import stats
+from utils.cache import response_cache
+from utils.streaming import stream_listing, STREAM_BATCH_SIZE
+from utils.serializers import user_schema
+from utils.profiles import profile_cache, load_profiles, parse_user_ids, MAX_PROFILE_IDS
+from utils.tasks import delete_user_content
+from utils.auth import auth_required, current_user, current_user_id, is_admin, revoke_current_token, TOKEN_COOKIE
+
+user_routes = Blueprint('user_routes', __name__)
+
+@user_routes.route('/test', methods=['GET'])
 def test():
     return jsonify({'message': 'API is working!'})
 
-@app.route('/api/update/<user_id>', methods=['PUT'])
+@user_routes.route('/update/<user_id>', methods=['PUT'])
+@auth_required
 def update_user(user_id):
-    user = User.query.get(user_id)
-    if not user or str(user.id) != user_id:
+    if str(current_user_id()) != user_id:
         return error_handler(403, 'You are not allowed to update this user')
+    user = current_user()
+    if not user:
+        return error_handler(404, 'User not found')
 
     if 'password' in request.json and request.json['password']:
         if len(request.json['password']) < 6:
             return error_handler(400, 'Password must be at least 6 characters')
-        hashed_password = bcrypt.hashpw(request.json['password'].encode('utf-8'), bcrypt.gensalt())
-        user.password = hashed_password.decode('utf-8')
+        user.password = request.json['password']
 
     if 'username' in request.json and request.json['username']:
         username = request.json['username']
@@ -39,47 +49,99 @@ def update_user(user_id):
         user.profile_picture = request.json['profilePicture']
 
     db.session.commit()
-    return jsonify(user.to_dict())
+    profile_cache.invalidate(user.id)
+    return jsonify(user_schema.dump(user))
 
-@app.route('/api/delete/<user_id>', methods=['DELETE'])
+@user_routes.route('/delete/<user_id>', methods=['DELETE'])
+@auth_required
 def delete_user(user_id):
-    user = User.query.get(user_id)
-    if not user or (not user.is_admin and str(user.id) != user_id):
+    if not is_admin() and str(current_user_id()) != user_id:
         return error_handler(403, 'You are not allowed to delete this user')
+    user = User.query.get(user_id)
+    if not user:
+        return error_handler(404, 'User not found')
 
-    db.session.delete(user)
+    # Delete just the user row here; their comments and likes are removed
+    # in batches by a background job.
+    db.session.execute(db.delete(User).where(User.id == user.id))
     db.session.commit()
+    profile_cache.invalidate(user.id)
+    stats.apply([(User, user.created_at, -1)])
+    delete_user_content.enqueue(user_id=user.id, idempotency_key=f'delete_user_content:{user.id}')
     return jsonify('User has been deleted')
 
-@app.route('/api/signout', methods=['POST'])
+@user_routes.route('/signout', methods=['POST'])
 def signout():
-    return jsonify('User has been signed out')
+    revoke_current_token()
+    response = jsonify('User has been signed out')
+    response.delete_cookie(TOKEN_COOKIE)
+    return response
 
-@app.route('/api/getusers', methods=['GET'])
+@user_routes.route('/getusers', methods=['GET'])
+@auth_required
 def get_users():
-    if not request.args.get('isAdmin'):
+    if not is_admin():
         return error_handler(403, 'You are not allowed to see all users')
 
     start_index = int(request.args.get('startIndex', 0))
     limit = int(request.args.get('limit', 9))
     sort_direction = 1 if request.args.get('sort') == 'asc' else -1
 
-    users = User.query.order_by(User.created_at.desc()).slice(start_index, start_index + limit).all()
-    total_users = User.query.count()
+    cursor = request.args.get('cursor')
+    next_cursor = None
+    stream = cursor is None and limit >= current_app.config.get('STREAM_LISTING_THRESHOLD', 500)
+    query = user_schema.select()
+    if cursor is not None:
+        try:
+            page = keyset_statement(query, 'created_at', User.created_at, User.id, True, cursor, limit)
+        except InvalidCursor as e:
+            return error_handler(400, str(e))
+        users, next_cursor = finish_keyset_page(db.session.execute(page).all(), 'created_at', User.created_at, limit)
+    else:
+        page = query.order_by(User.created_at.desc()).slice(start_index, start_index + limit)
+        if stream:
+            users = db.session.execute(page.execution_options(yield_per=STREAM_BATCH_SIZE))
+        else:
+            users = db.session.execute(page).all()
+    total_users = stats.total(User)
 
     from datetime import datetime, timedelta
     one_month_ago = datetime.now() - timedelta(days=30)
-    last_month_users = User.query.filter(User.created_at >= one_month_ago).count()
+    last_month_users = stats.last_month(User, one_month_ago)
+
+    if stream:
+        return stream_listing('users', users, user_schema.dump_row,
+                              totalUsers=total_users, lastMonthUsers=last_month_users, nextCursor=None)
 
     return jsonify({
-        'users': [user.to_dict() for user in users],
+        'users': user_schema.dump_rows(users),
         'totalUsers': total_users,
-        'lastMonthUsers': last_month_users
+        'lastMonthUsers': last_month_users,
+        'nextCursor': next_cursor
     })
 
-@app.route('/api/<user_id>', methods=['GET'])
+@user_routes.route('/<user_id>', methods=['GET'])
+@auth_required
 def get_user(user_id):
-    user = User.query.get(user_id)
+    if not user_id.isdigit():
+        return error_handler(404, 'User not found')
+    if is_admin() or current_user_id() == int(user_id):
+        # The full record, email included; never cached.
+        user = db.session.get(User, int(user_id))
+        user = user_schema.dump(user) if user else None
+    else:
+        user = load_profiles([int(user_id)]).get(int(user_id))
     if not user:
         return error_handler(404, 'User not found')
-    return jsonify(user.to_dict())
+    return jsonify(user)
+
+@user_routes.route('/profiles', methods=['GET'])
+def get_profiles():
+    # Several users' profiles in one request, e.g. every comment author on
+    # a page. Ids that do not exist are left out.
+    try:
+        user_ids = parse_user_ids(request.args.get('ids', ''))
+    except ValueError:
+        return error_handler(400, f'ids must be 1 to {MAX_PROFILE_IDS} comma-separated user ids')
+    profiles = load_profiles(user_ids)
+    return jsonify({'users': [profiles[user_id] for user_id in user_ids if user_id in profiles]})
@@ -1,18 +1,52 @@
+import math
+from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import MetaData
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy_serializer import SerializerMixin
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from utils.database import RoutingSession
+from utils.passwords import password_hasher
 
 metadata = MetaData(naming_convention={
+    "ix": "ix_%(table_name)s_%(column_0_name)s",
     "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
 })
 
-db = SQLAlchemy(metadata=metadata)
+db = SQLAlchemy(metadata=metadata, session_options={'class_': RoutingSession})
+
+COMMENT_PATH_DIGITS = 10
+COMMENT_MAX_DEPTH = 25
+
+# Hot scores weigh engagement against age the way Reddit's do: ten times the
+# engagement is worth HOT_GRAVITY_SECONDS of recency. Newer rows start higher
+# rather than older ones decaying, so a score only changes with engagement
+# and can be kept in an indexed column.
+HOT_EPOCH = datetime(2020, 1, 1)
+HOT_GRAVITY_SECONDS = 45000
+
+
+def hot_score(engagement, created_at):
+    return math.log10(max(engagement or 0, 1)) + (created_at - HOT_EPOCH).total_seconds() / HOT_GRAVITY_SECONDS
+
+
+def _hot_score_default(engagement_key):
+    # Scores a new row from the created_at and engagement it is inserted with.
+    def default(context):
+        parameters = context.get_current_parameters()
+        created_at = parameters.get('created_at')
+        if not isinstance(created_at, datetime):
+            created_at = datetime.utcnow()
+        return hot_score(parameters.get(engagement_key), created_at)
+    return default
+
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Keyset pagination on the admin users listing
+        db.Index('ix_users_created_at_id', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(100), nullable=False, unique=True)
@@ -36,10 +70,10 @@ class User(UserMixin, db.Model):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.check(password, self.password_hash)
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -47,6 +81,17 @@ class User(UserMixin, db.Model):
 
 class Post(db.Model):
     __tablename__ = 'posts'
+    __table_args__ = (
+        # Keyset pagination on getposts for the default and dashboard sorts
+        db.Index('ix_posts_created_at_id', 'created_at', 'id'),
+        db.Index('ix_posts_updated_at_id', 'updated_at', 'id'),
+        # getposts?userId= and ?category= filter, then sort by created_at
+        db.Index('ix_posts_user_id_created_at', 'user_id', 'created_at', 'id'),
+        db.Index('ix_posts_category_created_at', 'category', 'created_at', 'id'),
+        # getposts?sort=hot and ?sort=top
+        db.Index('ix_posts_hot_score_id', 'hot_score', 'id'),
+        db.Index('ix_posts_engagement_id', 'engagement', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -55,6 +100,9 @@ class Post(db.Model):
     image = db.Column(db.String(200), default='https://www.hostinger.com/tutorials/wp-content/uploads/sites/2/2021/09/how-to-write-a-blog-post.png')
     category = db.Column(db.String(50), default='uncategorized')
     slug = db.Column(db.String(100), nullable=False, unique=True)
+    # Comments on the post plus likes on those comments
+    engagement = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    hot_score = db.Column(db.Float, nullable=False, default=_hot_score_default('engagement'), server_default='0')
     created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
     updated_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
 
@@ -70,6 +118,22 @@ class Post(db.Model):
 
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (
+        # Keyset pagination on the admin comments listing
+        db.Index('ix_comments_created_at_id', 'created_at', 'id'),
+        # getPostComments and the post cascade delete
+        db.Index('ix_comments_post_id_created_at', 'post_id', 'created_at'),
+        # The user cascade delete
+        db.Index('ix_comments_user_id', 'user_id'),
+        # Top-level page of a post's threads, the replies of a comment, and
+        # a whole branch as one range scan on its path prefix
+        db.Index('ix_comments_post_id_parent_id_created_at', 'post_id', 'parent_id', 'created_at', 'id'),
+        db.Index('ix_comments_parent_id_created_at', 'parent_id', 'created_at', 'id'),
+        db.Index('ix_comments_post_id_path', 'post_id', 'path'),
+        # getPostComments?sort=hot and ?sort=top
+        db.Index('ix_comments_post_id_hot_score', 'post_id', 'hot_score', 'id'),
+        db.Index('ix_comments_post_id_number_of_likes', 'post_id', 'number_of_likes', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -77,16 +141,69 @@ class Comment(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
     # Foreign Key to store the user id
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    likes = db.Column(db.PickleType, default=[])
     number_of_likes = db.Column(db.Integer, default=0)
+    hot_score = db.Column(db.Float, nullable=False, default=_hot_score_default('number_of_likes'), server_default='0')
+    # The comment this one replies to, None for a top-level comment
+    parent_id = db.Column(db.Integer, db.ForeignKey('comments.id', ondelete='CASCADE'))
+    # Materialized path: the ids of every ancestor, root first, each zero-padded
+    # to COMMENT_PATH_DIGITS so a branch sorts and range-scans as a prefix
+    path = db.Column(db.String(COMMENT_PATH_DIGITS * COMMENT_MAX_DEPTH), nullable=False, default='', server_default='')
     created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
     updated_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
 
     # Relationship mapping the comment to related user
-    user = db.relationship('User', back_populates='comments', cascade='all, delete-orphan')
+    user = db.relationship('User', back_populates='comments')
 
     # Relationship mapping the comment to related post
-    post = db.relationship('Post', back_populates='comments', cascade='all, delete-orphan')
+    post = db.relationship('Post', back_populates='comments')
+
+    # Relationship mapping the comment to the users who liked it
+    like_rows = db.relationship('CommentLike', back_populates='comment', cascade='all, delete-orphan')
+
+    # Association proxy to get the ids of the users who liked this comment
+    likes = association_proxy('like_rows', 'user_id',
+                                 creator=lambda user_id: CommentLike(user_id=user_id))
+
+    @property
+    def depth(self):
+        return len(self.path) // COMMENT_PATH_DIGITS
+
+    @property
+    def branch_path(self):
+        # The path of this comment's replies, and the prefix of its whole branch.
+        return self.path + str(self.id).zfill(COMMENT_PATH_DIGITS)
 
     def __repr__(self):
         return f'<Comment {self.id}>'
+
+
+class CommentLike(db.Model):
+    __tablename__ = 'comment_likes'
+
+    # The composite primary key is the unique (comment_id, user_id) index
+    comment_id = db.Column(db.Integer, db.ForeignKey('comments.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+    # Relationship mapping the like to its comment
+    comment = db.relationship('Comment', back_populates='like_rows')
+
+    def __repr__(self):
+        return f'<CommentLike {self.comment_id}:{self.user_id}>'
+
+
+class PostFacet(db.Model):
+    __tablename__ = 'post_facets'
+    __table_args__ = (
+        # The largest values of a facet first
+        db.Index('ix_post_facets_facet_post_count', 'facet', 'post_count'),
+    )
+
+    # Materialized post counts: facet is 'category' or 'author', value the
+    # category name or the author's user id
+    facet = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(100), primary_key=True)
+    post_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<PostFacet {self.facet}:{self.value}>'
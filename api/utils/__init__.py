@@ -0,0 +1 @@
+from utils.error import error_handler
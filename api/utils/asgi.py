@@ -0,0 +1,241 @@
+import asyncio
+import io
+import re
+from datetime import datetime, timedelta
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from flask import make_response, request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from config import engine_options
+from models import User, Post, Comment
+from utils import error_handler
+from controllers.post_controller import posts_listing
+from controllers.comment_controller import post_comments_listing
+from utils.auth import token_cache, AuthError, TOKEN_COOKIE
+from utils.cache import response_cache, CACHE_CONTROL
+from utils.database import configure_engine
+from utils.metrics import metrics
+from utils.pagination import InvalidCursor, InvalidQuery
+from utils.profiles import profile_cache, profiles_statement
+from utils.search import ensure_search_index
+from utils.slugs import post_cache
+from utils.serializers import post_schema, public_profile_schema, user_schema
+from utils.stats import stats
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+
+def async_database_url(url):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]).render_as_string(hide_password=False)
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+class AsyncReadApp:
+    # ASGI application serving the hot read paths (getposts, getPostComments,
+    # posts by slug and the user profile) with async handlers on an async
+    # engine, and handing every other request to the Flask app on a thread
+    # pool. The handlers reuse the Flask views' statements, serializers,
+    # caches and stats, and run inside the Flask app's request hooks, so both
+    # paths answer the same requests identically.
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        config = flask_app.config
+        self.wsgi = WSGIMiddleware(flask_app, workers=config.get('ASGI_WSGI_WORKERS', 10))
+        url = config.get('ASYNC_DATABASE_URL')
+        if not url:
+            # Reads go to the replica when there is one, as on the sync path.
+            replica = config.get('SQLALCHEMY_BINDS', {}).get('replica')
+            url = async_database_url(replica['url'] if replica else config['SQLALCHEMY_DATABASE_URI'])
+        self.engine = create_async_engine(url, **engine_options(url))
+        configure_engine(self.engine.sync_engine)
+        metrics.instrument_engine(self.engine.sync_engine)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.post_route = re.compile(r'^/api/post/getpost/([^/]+)$')
+        self.routes = [
+            (re.compile(r'^/api/post/getposts$'), 'posts', self.get_posts),
+            (re.compile(r'^/api/comment/getPostComments/(\d+)$'), 'comments', self.get_post_comments),
+            (re.compile(r'^/api/user/(\d+)$'), None, self.get_user),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            match = self.post_route.match(scope['path'])
+            if match:
+                return await self.dispatch(scope, send, self.serve_post(match.group(1)))
+            for pattern, namespace, handler in self.routes:
+                match = pattern.match(scope['path'])
+                if match:
+                    return await self.dispatch(scope, send, self.respond(namespace, handler, match.groups()))
+        return await self.wsgi(scope, receive, send)
+
+    async def dispatch(self, scope, send, handler):
+        # Runs the handler inside the Flask app's request pipeline, so these
+        # routes get the same rate limits, metrics, Server-Timing and CORS
+        # headers as the ones the Flask app serves, and the same JSON errors.
+        # Flask keeps its contexts in context variables, so each request's
+        # task has its own across awaits.
+        environ = build_environ(scope, io.BytesIO())
+        with self.flask_app.request_context(environ):
+            try:
+                response = self.flask_app.preprocess_request()
+                if response is None:
+                    response = await handler
+            except HTTPError as e:
+                response = error_handler(e.status_code, e.message)
+            except Exception as e:
+                response = error_handler(500, str(e))
+            finally:
+                handler.close()
+            response = self.flask_app.process_response(self.flask_app.make_response(response))
+            body, status, headers = response.get_wsgi_response(environ)
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        await send({'type': 'http.response.body', 'body': b''.join(body)})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Do the one-off synchronous setup the handlers would
+                # otherwise block the event loop on.
+                await asyncio.get_running_loop().run_in_executor(None, self._warm_up)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _warm_up(self):
+        with self.flask_app.app_context():
+            ensure_search_index()
+            for model in (User, Post, Comment):
+                stats.total(model)
+
+    async def respond(self, namespace, handler, params):
+        key = entry = None
+        if namespace is not None and response_cache.backend is not None:
+            key = response_cache.key(namespace, request.path, request.args.items(multi=True))
+            entry = response_cache.backend.get(key)
+        if entry is None:
+            body = self.encode(await handler(request.args, request.headers, *params))
+            if key is None:
+                return self.flask_app.response_class(body, mimetype='application/json')
+            entry = response_cache.store(key, body, 'application/json')
+        body, mimetype, etag = entry
+        return self.conditional(body, mimetype, etag)
+
+    async def serve_post(self, slug):
+        # Served from the slug cache the Flask view fills, with the same
+        # body and ETag.
+        entry = post_cache.get(slug)
+        if entry is None:
+            generation = post_cache.generation
+            async with self.session() as session:
+                post = (await session.execute(post_schema.select().filter_by(slug=slug))).first()
+            if post is None:
+                raise HTTPError(404, 'Post not found')
+            entry = post_cache.set(slug, self.encode(post_schema.dump_row(post)), generation)
+        body, etag = entry
+        return self.conditional(body, 'application/json', etag)
+
+    def conditional(self, body, mimetype, etag):
+        # As the Flask views answer a cached body.
+        if etag in request.if_none_match:
+            response = make_response('', 304)
+        else:
+            response = make_response(body, 200)
+            response.mimetype = mimetype
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        return response
+
+    def encode(self, obj):
+        # Byte-for-byte what jsonify produces, so both paths share ETags.
+        return (self.flask_app.json.dumps(obj) + '\n').encode('utf-8')
+
+    async def totals(self, model):
+        if not stats.is_fresh(model):
+            await asyncio.get_running_loop().run_in_executor(None, self._reload_stats, model)
+        return stats.total(model), stats.last_month(model, datetime.utcnow() - timedelta(days=30))
+
+    def _reload_stats(self, model):
+        with self.flask_app.app_context():
+            stats.total(model)
+
+    async def get_posts(self, args, headers):
+        try:
+            page, count, finish = posts_listing(args)
+        except InvalidQuery as e:
+            raise HTTPError(400, str(e))
+        async with self.session() as session:
+            posts, next_cursor = finish((await session.execute(page)).all())
+            total_posts = await session.scalar(count) if count is not None else None
+        total, last_month_posts = await self.totals(Post)
+        return {
+            'posts': post_schema.dump_rows(posts),
+            'totalPosts': total if total_posts is None else total_posts,
+            'lastMonthPosts': last_month_posts,
+            'nextCursor': next_cursor,
+        }
+
+    async def get_post_comments(self, args, headers, post_id):
+        try:
+            statement, finish = post_comments_listing(int(post_id), args)
+        except InvalidCursor as e:
+            raise HTTPError(400, str(e))
+        async with self.session() as session:
+            comments = (await session.execute(statement)).all()
+        return finish(comments)
+
+    async def get_user(self, args, headers, user_id):
+        token = self._token(headers)
+        if not token:
+            raise HTTPError(401, 'Unauthorized')
+        try:
+            claims = token_cache.decode(token, self.flask_app.config['JWT_SECRET'])
+        except AuthError as e:
+            raise HTTPError(e.status_code, e.message)
+        if claims.get('isAdmin') or claims.get('id') == user_id:
+            # The full record, email included; never cached.
+            async with self.session() as session:
+                rows = (await session.execute(user_schema.select().where(User.id == int(user_id)))).all()
+            found = {row.id: user_schema.dump_row(row) for row in rows}
+        else:
+            found, missing = profile_cache.get_many([int(user_id)])
+            if missing:
+                generation = profile_cache.generation
+                async with self.session() as session:
+                    rows = (await session.execute(profiles_statement(missing))).all()
+                found = {row.id: public_profile_schema.dump_row(row) for row in rows}
+                profile_cache.set_many(found, generation)
+        if not found:
+            raise HTTPError(404, 'User not found')
+        return found[int(user_id)]
+
+    def _token(self, headers):
+        authorization = headers.get('authorization', '')
+        if authorization.startswith('Bearer '):
+            return authorization[len('Bearer '):]
+        for part in headers.get('cookie', '').split(';'):
+            name, _, value = part.strip().partition('=')
+            if name == TOKEN_COOKIE:
+                return value
+        return None
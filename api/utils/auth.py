@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+import jwt
+from flask import current_app, g, request
+from models import db, User
+from utils.error import error_handler
+from utils.metrics import metrics
+
+ALGORITHM = 'HS256'
+TOKEN_COOKIE = 'access_token'
+
+
+class AuthError(Exception):
+    def __init__(self, message, status_code=401):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class TokenCache:
+    # Bounded LRU of token -> verified claims, so a token's HMAC is checked
+    # once rather than on every request. Entries are dropped when the token
+    # expires or is revoked.
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._claims = OrderedDict()
+        self._revoked = {}
+
+    @staticmethod
+    def _key(token):
+        return hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+
+    def decode(self, token, secret):
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            if key in self._revoked:
+                raise AuthError('Token has been revoked')
+            claims = self._claims.get(key)
+            if claims is not None:
+                if claims.get('exp', now + 1) <= now:
+                    del self._claims[key]
+                    raise AuthError('Token has expired')
+                self._claims.move_to_end(key)
+                return claims
+
+        try:
+            claims = jwt.decode(token, secret, algorithms=[ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise AuthError('Token has expired')
+        except jwt.InvalidTokenError:
+            raise AuthError('Invalid token')
+
+        with self._lock:
+            self._claims[key] = claims
+            while len(self._claims) > self.max_entries:
+                self._claims.popitem(last=False)
+        return claims
+
+    def revoke(self, token, secret):
+        try:
+            claims = jwt.decode(token, secret, algorithms=[ALGORITHM])
+        except jwt.InvalidTokenError:
+            return
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            self._claims.pop(key, None)
+            # Revoked tokens only need remembering until they would expire.
+            self._revoked = {k: exp for k, exp in self._revoked.items() if exp > now}
+            self._revoked[key] = claims.get('exp', float('inf'))
+
+    def clear(self):
+        with self._lock:
+            self._claims.clear()
+
+
+token_cache = TokenCache()
+
+
+def _secret():
+    return current_app.config['JWT_SECRET']
+
+
+def issue_token(user):
+    now = int(time.time())
+    claims = {
+        'id': str(user.id),
+        'isAdmin': bool(user.is_admin),
+        'iat': now,
+        'exp': now + current_app.config.get('JWT_EXPIRES_SECONDS', 7 * 24 * 3600),
+        # Without it two sign-ins in the same second get the same token, and
+        # signing out of one revokes the other.
+        'jti': os.urandom(8).hex(),
+    }
+    return jwt.encode(claims, _secret(), algorithm=ALGORITHM)
+
+
+def request_token():
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[len('Bearer '):]
+    return request.cookies.get(TOKEN_COOKIE)
+
+
+def current_claims():
+    # Verified claims for this request, decoded at most once per request.
+    if 'auth_claims' not in g:
+        token = request_token()
+        if not token:
+            raise AuthError('Unauthorized')
+        with metrics.phase('auth'):
+            g.auth_claims = token_cache.decode(token, _secret())
+    return g.auth_claims
+
+
+def current_user_id():
+    return int(current_claims()['id'])
+
+
+def is_admin():
+    return bool(current_claims().get('isAdmin', False))
+
+
+def current_user():
+    # The User row for this request, loaded at most once per request.
+    if 'auth_user' not in g:
+        g.auth_user = db.session.get(User, current_user_id())
+    return g.auth_user
+
+
+def revoke_current_token():
+    token = request_token()
+    if token:
+        token_cache.revoke(token, _secret())
+    g.pop('auth_claims', None)
+    g.pop('auth_user', None)
+
+
+def auth_required(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            current_claims()
+        except AuthError as e:
+            return error_handler(e.status_code, e.message)
+        return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,163 @@
+import json
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from models import db, Post, Comment
+from utils.slugs import unique_slugs
+from utils.stats import stats
+from utils.cache import response_cache
+from utils.ranking import refresh_posts
+from utils.facets import adjust_facets
+
+BATCH_SIZE = 1000
+
+# NDJSON field -> column, accepting the camelCase names the client uses.
+POST_FIELDS = {
+    'title': 'title', 'content': 'content', 'category': 'category', 'image': 'image',
+    'slug': 'slug', 'userId': 'user_id', 'user_id': 'user_id',
+    'createdAt': 'created_at', 'created_at': 'created_at',
+    'updatedAt': 'updated_at', 'updated_at': 'updated_at',
+}
+COMMENT_FIELDS = {
+    'content': 'content', 'postId': 'post_id', 'post_id': 'post_id',
+    'userId': 'user_id', 'user_id': 'user_id',
+    'numberOfLikes': 'number_of_likes', 'number_of_likes': 'number_of_likes',
+    'createdAt': 'created_at', 'created_at': 'created_at',
+    'updatedAt': 'updated_at', 'updated_at': 'updated_at',
+}
+MODELS = {'posts': (Post, POST_FIELDS), 'comments': (Comment, COMMENT_FIELDS)}
+
+
+class BulkImportError(ValueError):
+    pass
+
+
+def _to_row(record, fields):
+    if not isinstance(record, dict):
+        raise ValueError('expected a JSON object')
+    row = {}
+    for key, value in record.items():
+        column = fields.get(key)
+        if column is None:
+            continue
+        if column in ('created_at', 'updated_at') and isinstance(value, str):
+            value = datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+        row[column] = value
+    now = datetime.utcnow()
+    row.setdefault('created_at', now)
+    row.setdefault('updated_at', row['created_at'])
+    return row
+
+
+def _insert_post(row):
+    try:
+        with db.session.begin_nested():
+            db.session.execute(db.insert(Post), [row])
+        return True
+    except IntegrityError:
+        return False
+
+
+def _insert_posts(rows):
+    # Rows whose title or given slug is already taken, in the table or
+    # earlier in the batch, are skipped.
+    titles = [row['title'] for row in rows]
+    existing = set(db.session.scalars(db.select(Post.title).where(Post.title.in_(titles))))
+    given = [row['slug'] for row in rows if row.get('slug')]
+    taken = set(db.session.scalars(db.select(Post.slug).where(Post.slug.in_(given)))) if given else set()
+    fresh = []
+    for row in rows:
+        if row['title'] in existing or row.get('slug') in taken:
+            continue
+        existing.add(row['title'])
+        if row.get('slug'):
+            taken.add(row['slug'])
+        fresh.append(row)
+
+    missing = [row for row in fresh if not row.get('slug')]
+    for row, slug in zip(missing, unique_slugs([row['title'] for row in missing], reserved=taken)):
+        row['slug'] = slug
+    if fresh:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(Post), fresh)
+        except IntegrityError:
+            # Another writer took a title or slug since they were checked.
+            fresh = [row for row in fresh if _insert_post(row)]
+        # The ORM insert leaves out None values, so those get the default.
+        default_category = Post.category.default.arg
+        adjust_facets(
+            (default_category if row.get('category') is None else row['category'], row['user_id'], 1) for row in fresh
+        )
+    return len(fresh)
+
+
+def _insert_comments(rows):
+    db.session.execute(db.insert(Comment), rows)
+    refresh_posts({row['post_id'] for row in rows})
+    return len(rows)
+
+
+def _flush(kind, rows):
+    inserted = _insert_posts(rows) if kind == 'posts' else _insert_comments(rows)
+    db.session.commit()
+    return inserted
+
+
+def import_ndjson(kind, lines, batch_size=BATCH_SIZE):
+    # Reads one JSON object per line and inserts them in executemany batches,
+    # so memory stays flat regardless of input size. Posts whose title or
+    # slug is already taken are skipped. Returns (inserted, skipped).
+    model, fields = MODELS[kind]
+    required = [column.name for column in model.__table__.columns
+                if not column.nullable and column.default is None and not column.primary_key
+                and not (kind == 'posts' and column.name == 'slug')]
+
+    inserted = read = 0
+    batch = []
+    try:
+        for line_number, line in enumerate(lines, 1):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            try:
+                row = _to_row(json.loads(line), fields)
+            except ValueError as e:
+                raise BulkImportError(f'Line {line_number}: {e}')
+            missing = [column for column in required if row.get(column) in (None, '')]
+            if missing:
+                raise BulkImportError(f'Line {line_number}: missing {", ".join(missing)}')
+            batch.append(row)
+            read += 1
+            if len(batch) >= batch_size:
+                inserted += _flush(kind, batch)
+                batch = []
+        if batch:
+            inserted += _flush(kind, batch)
+    finally:
+        # Core inserts bypass the session events that keep these current;
+        # comments also move their posts' engagement.
+        stats.invalidate(model)
+        response_cache.invalidate(*{kind, 'posts'})
+    return inserted, read - inserted
+
+
+def export_ndjson(kind, batch_size=BATCH_SIZE):
+    # Yields one JSON line per row, streaming from a server-side cursor
+    # rather than loading the table into memory.
+    model, _ = MODELS[kind]
+    statement = db.select(model.__table__).order_by(model.id).execution_options(
+        stream_results=True, yield_per=batch_size
+    )
+    result = db.session.execute(statement)
+    try:
+        for row in result.mappings():
+            yield json.dumps(dict(row), default=_json_default, separators=(',', ':')) + '\n'
+    finally:
+        result.close()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
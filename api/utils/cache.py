@@ -0,0 +1,170 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import request, make_response
+
+
+# Clients and CDNs may store the body but must revalidate, which costs them a
+# 304 while the entry is current.
+CACHE_CONTROL = 'public, no-cache'
+
+
+class LocalBackend:
+    # In-process LRU with a per-entry TTL. Only sees invalidations made by
+    # this process, so use the redis backend when running several workers.
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+class RedisBackend:
+    # Works with any client exposing redis-py's get/set(ex=)/incr, such as
+    # redis.Redis or FakeRedis below.
+
+    def __init__(self, client, prefix='response-cache:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=max(int(ttl), 1))
+
+    def get_counter(self, key):
+        return int(self.client.get(self.prefix + key) or 0)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+
+class FakeRedis:
+    # Minimal in-memory stand-in for redis.Redis, for tests and local runs.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def get(self, key):
+        with self._lock:
+            value, expires_at = self._data.get(key, (None, None))
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._data.get(key, (0, None))[0] or 0) + 1
+            self._data[key] = (str(value).encode(), None)
+            return value
+
+
+class ResponseCache:
+    # Caches successful GET responses per namespace. Writes call
+    # invalidate(namespace), which bumps a generation number that is part of
+    # every key, so stale entries are never read again and simply age out.
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 60
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', 60)
+        backend = app.config.get('RESPONSE_CACHE_BACKEND', 'local')
+        if backend == 'redis':
+            import redis
+            self.backend = RedisBackend(redis.Redis.from_url(app.config['RESPONSE_CACHE_REDIS_URL']))
+        elif backend == 'fakeredis':
+            self.backend = RedisBackend(FakeRedis())
+        else:
+            self.backend = LocalBackend(app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+
+    def invalidate(self, *namespaces):
+        if self.backend is None:
+            return
+        for namespace in namespaces:
+            self.backend.incr(f'{namespace}:generation')
+
+    def key(self, namespace, path, args):
+        # args: (name, value) pairs of the query string.
+        generation = self.backend.get_counter(f'{namespace}:generation')
+        return f'{namespace}:{generation}:{path}?{urlencode(sorted(args))}'
+
+    def store(self, key, body, mimetype):
+        entry = (body, mimetype, hashlib.sha1(body).hexdigest())
+        self.backend.set(key, entry, self.ttl)
+        return entry
+
+    def cached(self, namespace):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.backend is None:
+                    return view(*args, **kwargs)
+
+                key = self.key(namespace, request.path, request.args.items(multi=True))
+                entry = self.backend.get(key)
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    entry = self.store(key, response.get_data(), response.mimetype)
+
+                body, mimetype, etag = entry
+                if etag in request.if_none_match:
+                    response = make_response('', 304)
+                else:
+                    response = make_response(body, 200)
+                    response.mimetype = mimetype
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = CACHE_CONTROL
+                return response
+            return wrapper
+        return decorator
+
+
+response_cache = ResponseCache()
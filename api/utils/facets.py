@@ -0,0 +1,110 @@
+from collections import Counter
+from sqlalchemy.exc import IntegrityError
+from models import db, Post, PostFacet, User
+from utils.search import search_posts
+
+FACET_LIMIT = 20
+MAX_FACET_LIMIT = 100
+
+
+def post_facets(category, user_id):
+    # The facet values a post with this category and author counts towards.
+    values = []
+    if category is not None:
+        values.append(('category', category))
+    if user_id is not None:
+        values.append(('author', str(user_id)))
+    return values
+
+
+def adjust_facets(changes):
+    # Applies (category, user_id, delta) changes to the materialized counts
+    # in the current transaction. Counts are adjusted in SQL, and a value
+    # seen for the first time is inserted, retrying as an update if another
+    # writer inserted it first.
+    deltas = Counter()
+    for category, user_id, delta in changes:
+        for key in post_facets(category, user_id):
+            deltas[key] += delta
+
+    for (facet, value), delta in deltas.items():
+        if not delta:
+            continue
+        row = db.update(PostFacet).where(PostFacet.facet == facet, PostFacet.value == value)
+        if db.session.execute(row.values(post_count=PostFacet.post_count + delta)).rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(PostFacet).values(facet=facet, value=value, post_count=delta))
+        except IntegrityError:
+            db.session.execute(row.values(post_count=PostFacet.post_count + delta))
+
+
+def rebuild_facets():
+    # Recomputes every count from the posts table.
+    db.session.execute(db.delete(PostFacet))
+    for facet, column in (('category', Post.category), ('author', Post.user_id)):
+        db.session.execute(db.insert(PostFacet).from_select(
+            ['facet', 'value', 'post_count'],
+            db.select(db.literal(facet), db.cast(column, db.String), db.func.count())
+            .where(column.is_not(None)).group_by(column),
+        ))
+    db.session.commit()
+
+
+def _materialized(limit):
+    counts = {}
+    for facet in ('category', 'author'):
+        counts[facet] = db.session.execute(
+            db.select(PostFacet.value, PostFacet.post_count)
+            .where(PostFacet.facet == facet, PostFacet.post_count > 0)
+            .order_by(PostFacet.post_count.desc(), PostFacet.value)
+            .limit(limit)
+        ).all()
+    return counts['category'], [(int(value), count) for value, count in counts['author']], None
+
+
+def _aggregated(args, limit):
+    # One pass over the matching posts, grouped by (category, author) and
+    # rolled up into both facets here.
+    query = db.select(Post.category, Post.user_id, db.func.count())
+    if args.get('category'):
+        query = query.filter_by(category=args.get('category'))
+    if args.get('userId'):
+        query = query.filter_by(user_id=args.get('userId'))
+    if args.get('searchTerm'):
+        query, _ = search_posts(query, args.get('searchTerm'))
+
+    categories, authors, total = Counter(), Counter(), 0
+    for category, user_id, count in db.session.execute(query.group_by(Post.category, Post.user_id)):
+        if category is not None:
+            categories[category] += count
+        authors[user_id] += count
+        total += count
+
+    def top(counter):
+        return sorted(counter.items(), key=lambda item: (-item[1], str(item[0])))[:limit]
+    return top(categories), top(authors), total
+
+
+def facet_counts(args):
+    # Post counts per category and per author. Unfiltered counts are read
+    # from the materialized table; with searchTerm, category or userId they
+    # are aggregated over the matching posts. Returns (categories, authors,
+    # total), total being None when it was not computed.
+    limit = min(int(args.get('limit', FACET_LIMIT)), MAX_FACET_LIMIT)
+    if any(args.get(key) for key in ('searchTerm', 'category', 'userId')):
+        categories, authors, total = _aggregated(args, limit)
+    else:
+        categories, authors, total = _materialized(limit)
+
+    names = {}
+    if authors:
+        names = dict(db.session.execute(
+            db.select(User.id, User.username).where(User.id.in_([user_id for user_id, _ in authors]))
+        ).all())
+    return (
+        [{'category': category, 'count': count} for category, count in categories],
+        [{'userId': user_id, 'username': names.get(user_id), 'count': count} for user_id, count in authors],
+        total,
+    )
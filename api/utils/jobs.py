@@ -0,0 +1,173 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        idempotency_key TEXT UNIQUE,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 5,
+        run_at REAL NOT NULL,
+        locked_at REAL,
+        last_error TEXT,
+        created_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at)",
+]
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_handlers = {}
+
+
+def job(name):
+    # Registers a function as the handler for jobs called `name` and adds
+    # func.enqueue(**payload). Handlers receive the payload as keyword
+    # arguments and must be idempotent, since a job whose worker dies is
+    # run again.
+    def decorator(func):
+        def enqueue(idempotency_key=None, delay=0, **payload):
+            return job_queue.enqueue(name, payload, idempotency_key=idempotency_key, delay=delay)
+
+        _handlers[name] = func
+        func.enqueue = enqueue
+        return func
+    return decorator
+
+
+class JobQueue:
+    # A small durable queue in its own SQLite file, independent of the main
+    # database. Jobs are claimed in batches inside an IMMEDIATE transaction,
+    # so several worker processes can share one queue.
+
+    def __init__(self, path='jobs.db', visibility_timeout=300, eager=False):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.eager = eager
+        self._local = threading.local()
+
+    def init_app(self, app):
+        self.path = app.config.get('JOB_QUEUE_PATH', self.path)
+        self.visibility_timeout = app.config.get('JOB_VISIBILITY_TIMEOUT', self.visibility_timeout)
+        self.eager = app.config.get('JOB_QUEUE_EAGER', self.eager)
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, name, payload=None, idempotency_key=None, delay=0, max_attempts=5):
+        # Returns the job id. Enqueuing again with an idempotency key that is
+        # already in the queue returns the existing job instead of a new one.
+        if name not in _handlers:
+            raise KeyError(f'No job handler registered for {name!r}')
+        payload = payload or {}
+        if self.eager:
+            _handlers[name](**payload)
+            return None
+
+        now = time.time()
+        conn = self._conn()
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO jobs (name, payload, idempotency_key, max_attempts, run_at, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (name, json.dumps(payload), idempotency_key, max_attempts, now + delay, now),
+        )
+        if cursor.rowcount:
+            return cursor.lastrowid
+        return conn.execute('SELECT id FROM jobs WHERE idempotency_key = ?', (idempotency_key,)).fetchone()['id']
+
+    def claim(self, limit=10):
+        now = time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Jobs left running by a worker that died become visible again.
+            conn.execute(
+                'UPDATE jobs SET status = ? WHERE status = ? AND locked_at < ?',
+                (QUEUED, RUNNING, now - self.visibility_timeout),
+            )
+            rows = conn.execute(
+                'SELECT * FROM jobs WHERE status = ? AND run_at <= ? ORDER BY run_at LIMIT ?',
+                (QUEUED, now, limit),
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    'UPDATE jobs SET status = ?, locked_at = ?, attempts = attempts + 1 WHERE id = ?',
+                    [(RUNNING, now, row['id']) for row in rows],
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return rows
+
+    def complete(self, job_id):
+        self._conn().execute('UPDATE jobs SET status = ?, locked_at = NULL WHERE id = ?', (DONE, job_id))
+
+    def fail(self, row, error):
+        attempts = row['attempts'] + 1
+        if attempts >= row['max_attempts']:
+            status, run_at = FAILED, row['run_at']
+        else:
+            # Exponential backoff: 2, 4, 8... seconds, capped at ten minutes.
+            status, run_at = QUEUED, time.time() + min(2 ** attempts, 600)
+        self._conn().execute(
+            'UPDATE jobs SET status = ?, run_at = ?, locked_at = NULL, last_error = ? WHERE id = ?',
+            (status, run_at, error, row['id']),
+        )
+
+    def purge(self, older_than=7 * 24 * 3600):
+        self._conn().execute(
+            'DELETE FROM jobs WHERE status = ? AND created_at < ?', (DONE, time.time() - older_than)
+        )
+
+    def counts(self):
+        rows = self._conn().execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status').fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def run_one_batch(self, limit=10, after_job=None):
+        rows = self.claim(limit)
+        for row in rows:
+            handler = _handlers.get(row['name'])
+            try:
+                if handler is None:
+                    raise KeyError(f'No job handler registered for {row["name"]!r}')
+                handler(**json.loads(row['payload']))
+            except Exception:
+                logger.exception('Job %s (%s) failed', row['id'], row['name'])
+                self.fail(row, traceback.format_exc(limit=5))
+            else:
+                self.complete(row['id'])
+            finally:
+                if after_job is not None:
+                    after_job()
+        return len(rows)
+
+    def work(self, poll_interval=1.0, limit=10, stop=None, after_job=None):
+        while stop is None or not stop.is_set():
+            if not self.run_one_batch(limit, after_job):
+                time.sleep(poll_interval)
+
+
+job_queue = JobQueue()
@@ -0,0 +1,323 @@
+import atexit
+import glob
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from sqlalchemy.exc import IntegrityError
+from models import db, Comment, CommentLike
+from utils.cache import response_cache
+from utils.ranking import add_comment_likes
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - no flock, see _lock_segment
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOG_PATTERN = 'likes-*.log'
+WRITE_BATCH_SIZE = 500
+
+
+def _lock_segment(fd):
+    # True when no other process holds the segment. Without flock every
+    # segment looks orphaned, so give each process its own LIKE_LOG_DIR.
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+class _Segment:
+    __slots__ = ('path', 'fd')
+
+    def __init__(self, path, fd):
+        self.path = path
+        self.fd = fd
+
+    def remove(self):
+        # Unlinked while still locked, so a process recovering segments
+        # never picks up one that has already been flushed.
+        os.unlink(self.path)
+        os.close(self.fd)
+
+
+def _read_segment(fd, entries):
+    with os.fdopen(os.dup(fd), 'r') as f:
+        for line in f:
+            # A line cut short by a crash was never acknowledged.
+            if not line.endswith('\n'):
+                break
+            comment_id, user_id, liked = line.split()
+            entries[(int(comment_id), int(user_id))] = liked == '1'
+
+
+def _has_like(comment_id, user_id):
+    return db.session.scalar(
+        db.select(db.exists().where(CommentLike.comment_id == comment_id, CommentLike.user_id == user_id))
+    )
+
+
+def _insert_like(row):
+    try:
+        with db.session.begin_nested():
+            db.session.execute(db.insert(CommentLike.__table__).values(**row))
+        return True
+    except IntegrityError:
+        return False
+
+
+def write_likes(entries):
+    # Brings comment_likes in line with entries, {(comment_id, user_id): liked},
+    # and moves each comment's count by the rows actually added or removed.
+    # Applying the same entries twice changes nothing the second time. Leaves
+    # committing to the caller.
+    keys = sorted(entries)
+    live = set()
+    comment_ids = sorted({comment_id for comment_id, _ in keys})
+    for start in range(0, len(comment_ids), WRITE_BATCH_SIZE):
+        batch = comment_ids[start:start + WRITE_BATCH_SIZE]
+        live.update(db.session.scalars(db.select(Comment.id).where(Comment.id.in_(batch))))
+
+    key_column = db.tuple_(CommentLike.comment_id, CommentLike.user_id)
+    deltas = Counter()
+    # One delete per comment, so its rowcount is that comment's change.
+    unliked = defaultdict(list)
+    for comment_id, user_id in keys:
+        if not entries[comment_id, user_id] and comment_id in live:
+            unliked[comment_id].append(user_id)
+    for comment_id, user_ids in unliked.items():
+        for start in range(0, len(user_ids), WRITE_BATCH_SIZE):
+            deltas[comment_id] -= db.session.execute(
+                db.delete(CommentLike.__table__)
+                .where(CommentLike.comment_id == comment_id, CommentLike.user_id.in_(user_ids[start:start + WRITE_BATCH_SIZE]))
+            ).rowcount
+
+    liked = [key for key in keys if entries[key] and key[0] in live]
+    for start in range(0, len(liked), WRITE_BATCH_SIZE):
+        batch = liked[start:start + WRITE_BATCH_SIZE]
+        existing = set(db.session.execute(db.select(CommentLike.comment_id, CommentLike.user_id).where(key_column.in_(batch))))
+        rows = [{'comment_id': comment_id, 'user_id': user_id} for comment_id, user_id in batch if (comment_id, user_id) not in existing]
+        if not rows:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(CommentLike.__table__), rows)
+        except IntegrityError:
+            # Another process added some of them first.
+            rows = [row for row in rows if _insert_like(row)]
+        for row in rows:
+            deltas[row['comment_id']] += 1
+
+    for comment_id, delta in sorted(deltas.items()):
+        if delta:
+            add_comment_likes(comment_id, delta)
+    return deltas
+
+
+class LikeBuffer:
+    # Collects like toggles in memory and writes them in one transaction
+    # every flush_interval seconds, or sooner once max_events have come in,
+    # so a burst of likes on a popular comment costs a single update of it
+    # instead of a transaction per click. Entries hold each (comment, user)'s
+    # latest state rather than the toggles that led to it, which makes
+    # writing them again harmless.
+    #
+    # Each toggle is appended to this process's log segment before it is
+    # acknowledged, and a segment is deleted only once the flush covering it
+    # has committed. A process holds a lock on its segments while it runs;
+    # segments nobody holds belong to a process that died and are replayed.
+    #
+    # The buffered state is this process's alone. Toggles for the same
+    # (comment, user) taken by two processes are not ordered against each
+    # other, so only enable it where one process serves the like route.
+
+    def __init__(self):
+        # Off until init_app, so apps that do not ask for buffering write
+        # every like straight away.
+        self.enabled = False
+        self.app = None
+        self.flush_interval = 0.05
+        self.max_events = 500
+        self.log_dir = 'like-log'
+        self.fsync = False
+        self.flushes = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._pending = {}
+        self._flushing = {}
+        # Bumped whenever a flush commits, so a toggle can tell that its
+        # read of comment_likes may predate it.
+        self._generation = 0
+        self._events = 0
+        self._segments = []
+        self._current = None
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('LIKE_BUFFER_ENABLED', False)
+        self.flush_interval = app.config.get('LIKE_FLUSH_INTERVAL_MS', 50) / 1000
+        self.max_events = app.config.get('LIKE_FLUSH_MAX_EVENTS', self.max_events)
+        self.log_dir = app.config.get('LIKE_LOG_DIR', self.log_dir)
+        self.fsync = app.config.get('LIKE_LOG_FSYNC', self.fsync)
+        if self.enabled:
+            atexit.register(self._shutdown)
+
+    def toggle(self, comment_id, user_id):
+        # Likes the comment if the user's latest state is unliked and the
+        # other way round. Returns the new state.
+        key = (comment_id, user_id)
+        while True:
+            with self._lock:
+                self._start()
+                generation = self._generation
+                state = self._pending.get(key, self._flushing.get(key))
+            stored = _has_like(comment_id, user_id) if state is None else state
+            with self._lock:
+                state = self._pending.get(key, self._flushing.get(key))
+                if state is None and self._generation != generation:
+                    continue
+                liked = not (stored if state is None else state)
+                self._append(f'{comment_id} {user_id} {int(liked)}\n')
+                self._pending[key] = liked
+                self._events += 1
+                full = self._events >= self.max_events
+            break
+        if full:
+            self._wake.set()
+        return liked
+
+    def overlay(self, comment_id, likes):
+        # The ids of the users liking the comment once its unflushed toggles
+        # land, given those stored now.
+        likes = set(likes)
+        with self._lock:
+            for entries in (self._flushing, self._pending):
+                for (entry_comment_id, user_id), liked in entries.items():
+                    if entry_comment_id == comment_id:
+                        (likes.add if liked else likes.discard)(user_id)
+        return likes
+
+    def flush(self):
+        # Writes out everything buffered so far. Returns the number of
+        # entries written. Toggles keep being accepted, into a new segment,
+        # while it runs.
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._flushing, self._pending = self._pending, {}
+                self._events = 0
+                segments, self._segments, self._current = self._segments, [], None
+            try:
+                deltas = write_likes(self._flushing)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                with self._lock:
+                    self._pending = {**self._flushing, **self._pending}
+                    self._flushing = {}
+                    self._segments = segments + self._segments
+                raise
+            with self._lock:
+                written = len(self._flushing)
+                self._flushing = {}
+                self._generation += 1
+                self.flushes += 1
+            for segment in segments:
+                segment.remove()
+            if any(deltas.values()):
+                response_cache.invalidate('comments', 'posts')
+            return written
+
+    def recover(self):
+        # Replays the segments of processes that stopped before flushing
+        # them. Returns the number of entries replayed.
+        entries = {}
+        claimed = []
+        paths = glob.glob(os.path.join(self.log_dir, LOG_PATTERN))
+        for path in sorted(paths, key=os.path.getmtime):
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            if not _lock_segment(fd) or os.fstat(fd).st_nlink == 0:
+                os.close(fd)
+                continue
+            claimed.append(_Segment(path, fd))
+            _read_segment(fd, entries)
+        try:
+            if entries:
+                write_likes(entries)
+                db.session.commit()
+                response_cache.invalidate('comments', 'posts')
+        except Exception:
+            db.session.rollback()
+            for segment in claimed:
+                os.close(segment.fd)
+            raise
+        for segment in claimed:
+            segment.remove()
+        return len(entries)
+
+    def _start(self):
+        # Called with self._lock held. Worker processes forked after
+        # init_app start their own flusher and segments on first use.
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._pending, self._flushing, self._segments, self._current = {}, {}, [], None
+        self._events = 0
+        os.makedirs(self.log_dir, exist_ok=True)
+        threading.Thread(target=self._run, name='like-buffer', daemon=True).start()
+
+    def _append(self, line):
+        # Called with self._lock held.
+        if self._current is None:
+            # Named and locked before it is visible under its real name, so
+            # recover() never takes a segment that is still being set up.
+            path = os.path.join(self.log_dir, f'likes-{os.getpid()}-{time.time_ns()}.log')
+            fd = os.open(path + '.new', os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o600)
+            _lock_segment(fd)
+            os.rename(path + '.new', path)
+            self._current = _Segment(path, fd)
+            self._segments.append(self._current)
+        os.write(self._current.fd, line.encode())
+        if self.fsync:
+            # Only needed to survive the machine going down; the write alone
+            # survives the process dying.
+            os.fsync(self._current.fd)
+
+    def _run(self):
+        with self.app.app_context():
+            try:
+                self.recover()
+            except Exception:
+                logger.exception('Replaying the like log failed')
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception('Flushing buffered likes failed, will retry')
+
+    def _shutdown(self):
+        if self._pid != os.getpid():
+            return
+        with self.app.app_context():
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing buffered likes at exit failed; the like log still has them')
+
+
+like_buffer = LikeBuffer()
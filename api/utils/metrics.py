@@ -0,0 +1,247 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ('auth', 'sql', 'serialize', 'json')
+_UNSAFE_FILENAME_RE = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+class _RequestState:
+    __slots__ = ('start', 'phases', 'active', 'statements', 'profiler')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.active = set()
+        self.statements = 0
+        self.profiler = None
+
+
+class _Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    # Per-route request timings split into phases (auth, sql, serialize,
+    # json, and whatever is left), SQL statement counts and durations, and
+    # the slowest recent statements. Figures are per process; scrape every
+    # worker, or sum them, when running more than one.
+
+    def __init__(self):
+        self.enabled = True
+        self.server_timing = True
+        self.slow_query_seconds = 0.1
+        self.profile_rate = 0.0
+        self.profile_threshold = 0.5
+        self.profile_dir = 'profiles'
+        self.slow_queries = deque(maxlen=50)
+        self._lock = threading.Lock()
+        self._profile_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._requests = defaultdict(int)
+        self._latency = defaultdict(_Histogram)
+        self._phase_seconds = defaultdict(float)
+        self._statements = defaultdict(int)
+        self._sql = _Histogram()
+        self._slow_total = 0
+        self._profiles_written = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        self.server_timing = app.config.get('METRICS_SERVER_TIMING', True)
+        self.slow_query_seconds = app.config.get('METRICS_SLOW_QUERY_MS', 100) / 1000
+        self.slow_queries = deque(maxlen=app.config.get('METRICS_SLOW_QUERY_SAMPLES', 50))
+        self.profile_rate = app.config.get('METRICS_PROFILE_RATE', 0.0)
+        self.profile_threshold = app.config.get('METRICS_PROFILE_THRESHOLD_MS', 500) / 1000
+        self.profile_dir = app.config.get('METRICS_PROFILE_DIR', 'profiles')
+        if not self.enabled:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def instrument_engine(self, engine):
+        if self.enabled:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(engine, 'handle_error', self._handle_error)
+
+    def _state(self):
+        if not has_request_context():
+            return None
+        return g.get('_metrics')
+
+    @contextmanager
+    def phase(self, name):
+        # Adds the time spent inside the block to this request's `name`
+        # phase. Nested blocks of the same phase are only counted once.
+        state = self._state()
+        if state is None or name in state.active:
+            yield
+            return
+        state.active.add(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            state.active.discard(name)
+            state.phases[name] += time.perf_counter() - start
+
+    def _before_request(self):
+        state = g._metrics = _RequestState()
+        if self.profile_rate and random.random() < self.profile_rate and self._profile_lock.acquire(blocking=False):
+            # cProfile allows one active profiler, so at most one request at
+            # a time is profiled.
+            state.profiler = cProfile.Profile()
+            state.profiler.enable()
+
+    def _after_request(self, response):
+        state = g.get('_metrics')
+        if state is None:
+            return response
+        elapsed = time.perf_counter() - state.start
+        rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+        if state.profiler is not None:
+            self._finish_profile(state, rule, elapsed)
+
+        other = max(elapsed - sum(state.phases.values()), 0.0)
+        with self._lock:
+            self._requests[(rule, request.method, response.status_code)] += 1
+            self._latency[(rule, request.method)].observe(elapsed)
+            for name, seconds in state.phases.items():
+                self._phase_seconds[(rule, name)] += seconds
+            self._phase_seconds[(rule, 'other')] += other
+            self._statements[rule] += state.statements
+
+        if self.server_timing:
+            timings = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in state.phases.items() if seconds]
+            timings.append(f'sql-count;desc="{state.statements} statements"')
+            timings.append(f'total;dur={elapsed * 1000:.2f}')
+            response.headers['Server-Timing'] = ', '.join(timings)
+        return response
+
+    def _teardown_request(self, exc):
+        state = g.pop('_metrics', None)
+        if state is not None and state.profiler is not None:
+            # after_request did not run, e.g. the request raised.
+            state.profiler.disable()
+            self._profile_lock.release()
+
+    def _finish_profile(self, state, rule, elapsed):
+        profiler, state.profiler = state.profiler, None
+        profiler.disable()
+        self._profile_lock.release()
+        if elapsed < self.profile_threshold:
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = _UNSAFE_FILENAME_RE.sub('', rule.strip('/').replace('/', '.')) or 'root'
+        path = os.path.join(self.profile_dir, f'{name}-{int(time.time() * 1000)}-{int(elapsed * 1000)}ms.prof')
+        profiler.dump_stats(path)
+        with self._lock:
+            self._profiles_written += 1
+        logger.info('Wrote profile of %s %s (%.0f ms) to %s', request.method, request.path, elapsed * 1000, path)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_query_start'].pop()
+        state = self._state()
+        rule = None
+        if state is not None:
+            state.statements += 1
+            state.phases['sql'] += elapsed
+            rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        with self._lock:
+            self._sql.observe(elapsed)
+            if elapsed >= self.slow_query_seconds:
+                self._slow_total += 1
+                self.slow_queries.append({
+                    'at': time.time(),
+                    'ms': round(elapsed * 1000, 2),
+                    'route': rule,
+                    'statement': statement[:1000],
+                })
+
+    def _handle_error(self, context):
+        # A failed statement never reaches after_cursor_execute.
+        if context.connection is not None and context.connection.info.get('metrics_query_start'):
+            context.connection.info['metrics_query_start'].pop()
+
+    def render(self):
+        # The Prometheus text exposition format.
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def histogram(name, labels, hist):
+            prefix = labels + ',' if labels else ''
+            suffix = '{' + labels + '}' if labels else ''
+            cumulative = 0
+            for bound, count in zip(BUCKETS, hist.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {hist.count}')
+            lines.append(f'{name}_sum{suffix} {hist.total:.6f}')
+            lines.append(f'{name}_count{suffix} {hist.count}')
+
+        with self._lock:
+            header('http_requests_total', 'counter', 'Requests served, by route, method and status.')
+            for (rule, method, status), count in sorted(self._requests.items()):
+                lines.append(f'http_requests_total{{route="{rule}",method="{method}",status="{status}"}} {count}')
+
+            header('http_request_duration_seconds', 'histogram', 'Request latency, by route and method.')
+            for (rule, method), hist in sorted(self._latency.items()):
+                histogram('http_request_duration_seconds', f'route="{rule}",method="{method}"', hist)
+
+            header('http_request_phase_seconds_total', 'counter', 'Time spent serving requests, by route and phase.')
+            for (rule, name), seconds in sorted(self._phase_seconds.items()):
+                lines.append(f'http_request_phase_seconds_total{{route="{rule}",phase="{name}"}} {seconds:.6f}')
+
+            header('db_statements_total', 'counter', 'SQL statements issued while serving requests, by route.')
+            for rule, count in sorted(self._statements.items()):
+                lines.append(f'db_statements_total{{route="{rule}"}} {count}')
+
+            header('db_statement_duration_seconds', 'histogram', 'SQL statement latency.')
+            histogram('db_statement_duration_seconds', '', self._sql)
+
+            header('db_slow_statements_total', 'counter',
+                   f'SQL statements slower than {self.slow_query_seconds * 1000:g} ms.')
+            lines.append(f'db_slow_statements_total {self._slow_total}')
+
+            header('profiles_written_total', 'counter', 'Sampled request profiles written to disk.')
+            lines.append(f'profiles_written_total {self._profiles_written}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,65 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+class InvalidCursor(InvalidQuery):
+    pass
+
+
+def encode_cursor(sort_key, value, row_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps({'k': sort_key, 'v': value, 'id': row_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort_key, sort_column):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if payload['k'] != sort_key:
+            raise InvalidCursor('Cursor does not match the requested sort')
+        value = payload['v']
+        if value is not None and sort_column.type.python_type is datetime:
+            value = datetime.fromisoformat(value)
+        return value, int(payload['id'])
+    except InvalidCursor:
+        raise
+    except (ValueError, KeyError, TypeError, NotImplementedError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def keyset_statement(query, sort_key, sort_column, id_column, descending, cursor, limit):
+    # Seeks past the last row of the previous page on (sort column, id) instead
+    # of using OFFSET, so every page costs one index range scan. Works on a
+    # Query or a select(); fetches one extra row to tell if there is a next page.
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort_key, sort_column)
+        position = tuple_(sort_column, id_column)
+        query = query.filter(position < (value, row_id) if descending else position > (value, row_id))
+    return query.limit(limit + 1)
+
+
+def finish_keyset_page(rows, sort_key, sort_column, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort_key, getattr(last, sort_column.key), last.id)
+    return rows, next_cursor
+
+
+def keyset_page(query, sort_key, sort_column, id_column, descending, cursor, limit):
+    rows = keyset_statement(query, sort_key, sort_column, id_column, descending, cursor, limit).all()
+    return finish_keyset_page(rows, sort_key, sort_column, limit)
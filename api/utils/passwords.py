@@ -0,0 +1,95 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+import bcrypt
+from werkzeug.security import check_password_hash
+from utils.metrics import metrics
+
+DEFAULT_ROUNDS = 12
+
+
+class PasswordHasherBusy(Exception):
+    status_code = 503
+    message = 'Too many sign-in requests, please try again shortly'
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+class PasswordHasher:
+    # bcrypt on a small process pool so hashing never holds the GIL of the
+    # web worker. At most queue_depth hashes may be running or waiting; past
+    # that callers get PasswordHasherBusy instead of piling up behind it.
+
+    def __init__(self, rounds=DEFAULT_ROUNDS, workers=2, queue_depth=16, timeout=10):
+        self.configure(rounds, workers, queue_depth, timeout)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+
+    def configure(self, rounds=DEFAULT_ROUNDS, workers=2, queue_depth=16, timeout=10):
+        self.rounds = rounds
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(queue_depth)
+
+    def init_app(self, app):
+        self.configure(
+            rounds=app.config.get('BCRYPT_ROUNDS', DEFAULT_ROUNDS),
+            workers=app.config.get('PASSWORD_HASH_WORKERS', 2),
+            queue_depth=app.config.get('PASSWORD_HASH_QUEUE_DEPTH', 16),
+            timeout=app.config.get('PASSWORD_HASH_TIMEOUT', 10),
+        )
+
+    def _executor(self):
+        # Pools do not survive fork, so each worker process starts its own.
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            with metrics.phase('auth'):
+                if self.workers <= 0:
+                    return func(*args)
+                future = self._executor().submit(func, *args)
+                try:
+                    return future.result(timeout=self.timeout)
+                except FutureTimeout:
+                    # Still queued behind other hashes: drop it rather than
+                    # leave it to run for nobody.
+                    future.cancel()
+                    raise PasswordHasherBusy()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, password.encode('utf-8'), self.rounds).decode('utf-8')
+
+    def check(self, password, hashed):
+        if not hashed:
+            return False
+        if not hashed.startswith('$2'):
+            # Hashes written by werkzeug before bcrypt was the only algorithm.
+            return check_password_hash(hashed, password)
+        return self._run(_check, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        if not hashed or not hashed.startswith('$2'):
+            return True
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+from models import db, User
+from utils.serializers import public_profile_schema
+
+MAX_PROFILE_IDS = 100
+
+
+class ProfileCache:
+    # Bounded LRU of user id -> public profile, read through by the
+    # profile endpoints. Entries are dropped when the user is updated or
+    # deleted in this process; the TTL bounds how stale other processes can
+    # get. Counts hits, misses and evictions so the size and TTL can be
+    # tuned from the metrics endpoint.
+
+    def __init__(self, max_entries=4096, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('PROFILE_CACHE_SIZE', self.max_entries)
+        self.ttl = app.config.get('PROFILE_CACHE_TTL', self.ttl)
+
+    def get_many(self, user_ids):
+        # Returns ({id: profile} for the cached ids, [the other ids]).
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for user_id in user_ids:
+                entry = self._entries.get(user_id)
+                if entry is not None and entry[1] < now:
+                    del self._entries[user_id]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    missing.append(user_id)
+                else:
+                    self._entries.move_to_end(user_id)
+                    found[user_id] = entry[0]
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def set_many(self, profiles, generation):
+        # generation is the value read before loading the profiles. If
+        # anything was invalidated since, they may predate that write and
+        # are not stored.
+        with self._lock:
+            if generation != self.generation or self.max_entries <= 0:
+                return
+            expires_at = time.monotonic() + self.ttl
+            for user_id, profile in profiles.items():
+                self._entries[user_id] = (profile, expires_at)
+                self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            self.generation += 1
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def render(self):
+        # Prometheus text lines, appended to the metrics endpoint's output.
+        with self._lock:
+            size = len(self._entries)
+        lines = []
+        for name, kind, help_text, value in (
+            ('profile_cache_hits_total', 'counter', 'Profiles served from the cache.', self.hits),
+            ('profile_cache_misses_total', 'counter', 'Profiles loaded from the database.', self.misses),
+            ('profile_cache_evictions_total', 'counter', 'Profiles dropped to stay within the size limit.', self.evictions),
+            ('profile_cache_expirations_total', 'counter', 'Profiles dropped for being older than the TTL.', self.expirations),
+            ('profile_cache_entries', 'gauge', 'Profiles currently cached.', size),
+        ):
+            lines.extend((f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {value}'))
+        return '\n'.join(lines) + '\n'
+
+
+def profiles_statement(user_ids):
+    return public_profile_schema.select().where(User.id.in_(user_ids))
+
+
+def load_profiles(user_ids):
+    # {id: public profile} for those of user_ids that exist, loading every
+    # one not cached in a single query.
+    found, missing = profile_cache.get_many(user_ids)
+    if missing:
+        generation = profile_cache.generation
+        loaded = {row.id: public_profile_schema.dump_row(row) for row in db.session.execute(profiles_statement(missing))}
+        profile_cache.set_many(loaded, generation)
+        found.update(loaded)
+    return found
+
+
+def parse_user_ids(value):
+    # '3,1,3' -> [3, 1]. Raises ValueError for anything else, or for more
+    # than MAX_PROFILE_IDS ids.
+    user_ids = list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+    if not user_ids or len(user_ids) > MAX_PROFILE_IDS:
+        raise ValueError(f'Provide between 1 and {MAX_PROFILE_IDS} user ids')
+    return user_ids
+
+
+profile_cache = ProfileCache()
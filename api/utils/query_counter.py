@@ -0,0 +1,32 @@
+from sqlalchemy import event
+
+
+class QueryCounter:
+    # Records every SQL statement sent to the engine while active:
+    #
+    #     with QueryCounter(db.engine) as queries:
+    #         client.get('/api/post/getposts')
+    #     assert queries.count <= 2
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self.parameters = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+        self.parameters.append(parameters)
+
+    def __enter__(self):
+        self.statements = []
+        self.parameters = []
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+        return False
@@ -0,0 +1,77 @@
+from models import db, Post, Comment, hot_score
+
+# ?sort= value -> the column it orders by, always descending.
+POST_SORTS = {'hot': 'hot_score', 'top': 'engagement'}
+COMMENT_SORTS = {'hot': 'hot_score', 'top': 'number_of_likes'}
+RESCORE_BATCH_SIZE = 500
+
+# Writes leave updated_at alone: engagement is not an edit.
+_rescore_posts = (
+    db.update(Post.__table__).where(Post.id == db.bindparam('row_id'))
+    .values(hot_score=db.bindparam('score'), updated_at=Post.updated_at)
+)
+
+
+def add_post_engagement(post_id, delta):
+    # Adjusts engagement in SQL, so concurrent writers never lose an update,
+    # and rescores the post from the value it now has. The row stays locked
+    # by the update until commit, so the read sees this writer's value; no
+    # RETURNING, which SQLite only has from 3.35.
+    updated = db.session.execute(
+        db.update(Post).where(Post.id == post_id)
+        .values(engagement=Post.engagement + delta, updated_at=Post.updated_at)
+    ).rowcount
+    if updated:
+        row = db.session.execute(db.select(Post.engagement, Post.created_at).where(Post.id == post_id)).first()
+        db.session.execute(_rescore_posts, [{'row_id': post_id, 'score': hot_score(*row)}])
+
+
+def add_comment_likes(comment_id, delta):
+    updated = db.session.execute(
+        db.update(Comment).where(Comment.id == comment_id)
+        .values(number_of_likes=Comment.number_of_likes + delta)
+    ).rowcount
+    if not updated:
+        return
+    likes, created_at, post_id = db.session.execute(
+        db.select(Comment.number_of_likes, Comment.created_at, Comment.post_id).where(Comment.id == comment_id)
+    ).one()
+    db.session.execute(db.update(Comment).where(Comment.id == comment_id).values(hot_score=hot_score(likes, created_at)))
+    add_post_engagement(post_id, delta)
+
+
+def rescore_comments(comment_ids):
+    rows = db.session.execute(
+        db.select(Comment.id, Comment.number_of_likes, Comment.created_at).where(Comment.id.in_(comment_ids))
+    ).all()
+    if rows:
+        db.session.execute(
+            db.update(Comment.__table__).where(Comment.id == db.bindparam('row_id'))
+            .values(hot_score=db.bindparam('score')),
+            [{'row_id': row_id, 'score': hot_score(likes, created_at)} for row_id, likes, created_at in rows],
+        )
+
+
+def refresh_posts(post_ids):
+    # Recounts engagement from the comments themselves, for changes made in
+    # bulk rather than one comment or like at a time. Leaves committing to
+    # the caller.
+    post_ids = list(post_ids)
+    totals = (
+        db.select(db.func.count() + db.func.coalesce(db.func.sum(Comment.number_of_likes), 0))
+        .where(Comment.post_id == Post.id)
+        .scalar_subquery()
+    )
+    for start in range(0, len(post_ids), RESCORE_BATCH_SIZE):
+        batch = post_ids[start:start + RESCORE_BATCH_SIZE]
+        db.session.execute(
+            db.update(Post).where(Post.id.in_(batch)).values(engagement=totals, updated_at=Post.updated_at)
+        )
+        rows = db.session.execute(
+            db.select(Post.id, Post.engagement, Post.created_at).where(Post.id.in_(batch))
+        ).all()
+        if rows:
+            db.session.execute(
+                _rescore_posts,
+                [{'row_id': row_id, 'score': hot_score(engagement, created_at)} for row_id, engagement, created_at in rows],
+            )
@@ -0,0 +1,192 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, g, request
+from utils.auth import token_cache, request_token, AuthError
+from utils.error import error_handler
+
+# Request classes and their (requests per second, burst) budgets. auth is
+# counted per IP since it runs bcrypt before there is a user; the others
+# per signed-in user, or per IP for anonymous clients.
+DEFAULT_LIMITS = {
+    'auth': (0.2, 10),
+    'search': (2.0, 20),
+    'write': (5.0, 50),
+    'read': (50.0, 200),
+}
+# Requests of these classes allowed to run at once per process; more are
+# turned away rather than queued behind the database or the bcrypt pool.
+DEFAULT_MAX_IN_FLIGHT = {'auth': 8, 'search': 16}
+SHARDS = 16
+REJECTED_MESSAGE = 'Too many requests, please slow down'
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+def parse_limits(spec):
+    # 'auth=0.2/10,search=2/20' -> {'auth': (0.2, 10.0), 'search': (2.0, 20.0)}
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        kind, _, budget = item.partition('=')
+        rate, _, burst = budget.partition('/')
+        limits[kind.strip()] = (float(rate), float(burst) if burst else max(1.0, float(rate)))
+    return limits
+
+
+def classify(method, path, args):
+    # The request class of an API request, or None for anything else.
+    if not path.startswith('/api/'):
+        return None
+    if path.startswith('/api/auth/'):
+        return 'auth'
+    if args.get('searchTerm'):
+        return 'search'
+    if method in WRITE_METHODS:
+        return 'write'
+    return 'read'
+
+
+class _Shard:
+    __slots__ = ('lock', 'buckets')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> [tokens, last refill time]
+        self.buckets = OrderedDict()
+
+
+class RateLimiter:
+    # Token buckets per (request class, client), split across shards with a
+    # lock each so concurrent requests rarely wait on one another. Each
+    # shard keeps its most recently seen clients; a forgotten client starts
+    # again with a full bucket. Limits are per process, so a client can get
+    # up to the number of workers times its budget.
+
+    def __init__(self, limits=None, max_in_flight=None, max_clients=100000):
+        # Off until init_app, so apps that do not ask for limits get none.
+        self.enabled = False
+        self.trusted_proxies = 0
+        self.limits = dict(limits or DEFAULT_LIMITS)
+        self.max_in_flight = dict(max_in_flight or DEFAULT_MAX_IN_FLIGHT)
+        self.max_clients = max_clients
+        self.rejected = {}
+        self._shards = [_Shard() for _ in range(SHARDS)]
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', False)
+        self.trusted_proxies = int(app.config.get('RATE_LIMIT_TRUST_PROXY', 0))
+        self.limits.update(app.config.get('RATE_LIMITS', {}))
+        self.max_in_flight.update(app.config.get('RATE_LIMIT_MAX_IN_FLIGHT', {}))
+        self.max_clients = app.config.get('RATE_LIMIT_MAX_CLIENTS', self.max_clients)
+        if self.enabled:
+            app.before_request(self._before_request)
+            app.teardown_request(self._teardown_request)
+
+    def take(self, kind, client):
+        # Takes a token from the client's bucket for this class. Returns 0
+        # when the request may go ahead, otherwise the seconds until it may.
+        rate, burst = self.limits[kind]
+        key = (kind, client)
+        shard = self._shards[hash(key) % SHARDS]
+        now = time.monotonic()
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                bucket = shard.buckets[key] = [float(burst), now]
+                if len(shard.buckets) > self.max_clients // SHARDS:
+                    shard.buckets.popitem(last=False)
+            else:
+                shard.buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            wait = (1 - bucket[0]) / rate
+        self._count_rejected(kind)
+        return wait
+
+    def enter(self, kind):
+        # Claims an in-flight slot for this class, if it is capped. Every
+        # successful enter() must be paired with leave().
+        cap = self.max_in_flight.get(kind)
+        if cap is None:
+            return True
+        with self._in_flight_lock:
+            if self._in_flight.get(kind, 0) >= cap:
+                admitted = False
+            else:
+                self._in_flight[kind] = self._in_flight.get(kind, 0) + 1
+                admitted = True
+        if not admitted:
+            self._count_rejected(kind)
+        return admitted
+
+    def leave(self, kind):
+        if kind in self.max_in_flight:
+            with self._in_flight_lock:
+                self._in_flight[kind] -= 1
+
+    def _count_rejected(self, kind):
+        # Approximate under contention; only read for reporting.
+        self.rejected[kind] = self.rejected.get(kind, 0) + 1
+
+    def admit(self, kind, client):
+        # Returns None when the request is admitted, holding an in-flight
+        # slot if its class has them, or the Retry-After seconds to answer
+        # with otherwise.
+        wait = self.take(kind, client)
+        if wait:
+            return max(1, math.ceil(wait))
+        if not self.enter(kind):
+            return 1
+        return None
+
+    def render(self):
+        # Prometheus text lines, appended to the metrics endpoint's output.
+        lines = [
+            '# HELP rate_limited_requests_total Requests turned away with a 429, by request class.',
+            '# TYPE rate_limited_requests_total counter',
+        ]
+        for kind, count in sorted(self.rejected.items()):
+            lines.append(f'rate_limited_requests_total{{class="{kind}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def client(self, kind, token, remote_addr, forwarded_for):
+        if kind != 'auth' and token:
+            try:
+                claims = token_cache.decode(token, current_app.config['JWT_SECRET'])
+                return 'user:' + str(claims['id'])
+            except (AuthError, KeyError):
+                pass
+        if self.trusted_proxies and forwarded_for:
+            # Each proxy appends the address it got the request from, so the
+            # client is the entry added by the outermost trusted one. Entries
+            # left of it were sent by the client and could be anything.
+            hops = [hop.strip() for hop in forwarded_for.split(',')]
+            if len(hops) >= self.trusted_proxies:
+                return 'ip:' + hops[-self.trusted_proxies]
+        return 'ip:' + (remote_addr or '')
+
+    def _before_request(self):
+        kind = classify(request.method, request.path, request.args)
+        if kind is None or request.method == 'OPTIONS':
+            return None
+        client = self.client(kind, request_token(), request.remote_addr, request.headers.get('X-Forwarded-For'))
+        retry_after = self.admit(kind, client)
+        if retry_after is not None:
+            response = error_handler(429, REJECTED_MESSAGE)
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+        g.rate_limit_kind = kind
+        return None
+
+    def _teardown_request(self, exc):
+        kind = g.pop('rate_limit_kind', None)
+        if kind is not None:
+            self.leave(kind)
+
+
+rate_limiter = RateLimiter()
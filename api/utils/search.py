@@ -0,0 +1,103 @@
+import re
+from sqlalchemy import text, event
+from sqlalchemy.exc import OperationalError
+from models import db, Post
+
+# External-content FTS5 index over posts.title/posts.content. The triggers keep
+# it in sync with every insert, update and delete on the posts table.
+POSTS_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5("
+    "title, content, content='posts', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS posts_fts_ai AFTER INSERT ON posts BEGIN "
+    "INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS posts_fts_ad AFTER DELETE ON posts BEGIN "
+    "INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS posts_fts_au AFTER UPDATE OF title, content ON posts BEGIN "
+    "INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); "
+    "INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content); "
+    "END",
+]
+
+POSTS_FTS_REBUILD = "INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')"
+
+# Title matches weigh ten times as much as body matches in the bm25 rank.
+POSTS_FTS_QUERY = (
+    "SELECT rowid AS post_id, bm25(posts_fts, 10.0, 1.0) AS rank "
+    "FROM posts_fts WHERE posts_fts MATCH :match"
+)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_available = {}
+
+
+def build_match_query(search_term):
+    # Every word must match, the last one as a prefix so results update
+    # while the user is still typing.
+    tokens = _TOKEN_RE.findall(search_term or '')
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens[:-1]]
+    terms.append(f'"{tokens[-1]}"*')
+    return ' '.join(terms)
+
+
+def ensure_search_index(engine=None):
+    engine = engine or db.engine
+    if engine.url in _available:
+        return _available[engine.url]
+
+    if engine.dialect.name != 'sqlite':
+        _available[engine.url] = False
+        return False
+
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posts_fts'"
+            )).first()
+            for statement in POSTS_FTS_DDL:
+                conn.execute(text(statement))
+            if not exists:
+                conn.execute(text(POSTS_FTS_REBUILD))
+        _available[engine.url] = True
+    except OperationalError:
+        # SQLite built without FTS5 (or no posts table yet); fall back to LIKE.
+        _available[engine.url] = False
+    return _available[engine.url]
+
+
+def rebuild_search_index(engine=None):
+    engine = engine or db.engine
+    _available.pop(engine.url, None)
+    if not ensure_search_index(engine):
+        return False
+    with engine.begin() as conn:
+        conn.execute(text(POSTS_FTS_REBUILD))
+    return True
+
+
+def search_posts(query, search_term):
+    # Returns the filtered query and a rank column to order by (lower is better),
+    # or None for the rank when the full-text index is not available.
+    if not ensure_search_index():
+        pattern = f'%{search_term}%'
+        return query.filter(Post.title.ilike(pattern) | Post.content.ilike(pattern)), None
+
+    match = build_match_query(search_term)
+    if match is None:
+        return query.filter(db.false()), None
+
+    matches = text(POSTS_FTS_QUERY).bindparams(match=match).columns(
+        post_id=db.Integer, rank=db.Float
+    ).subquery('post_matches')
+    return query.join(matches, matches.c.post_id == Post.id), matches.c.rank
+
+
+@event.listens_for(Post.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        for statement in POSTS_FTS_DDL:
+            connection.execute(text(statement))
@@ -0,0 +1,100 @@
+from models import db, User, Post, Comment, CommentLike
+from utils.metrics import metrics
+
+# Keys the client reads under a name other than the field's camelCase one;
+# it was written against Mongo documents.
+RENAMED_KEYS = {'id': '_id'}
+
+
+def camel_case(name):
+    head, *rest = name.split('_')
+    return head + ''.join(word.title() for word in rest)
+
+
+def _ids(value):
+    # A comma-separated list from aggregate_strings, or None for no rows.
+    return [int(item) for item in value.split(',')] if value else []
+
+
+class Schema:
+    # An explicit list of fields and the camelCase keys they are sent under.
+    # Listings select just those columns and serialize the result tuples
+    # with dump_rows(), never building ORM objects. Objects a view already
+    # has, such as one it has just written, go through dump().
+    #
+    # `columns` are extra fields computed in SQL, {name: (expression,
+    # convert)}, and `computed` the same fields computed from an object.
+
+    def __init__(self, model, fields, computed=None, columns=None):
+        self.model = model
+        self.fields = fields
+        self.computed = computed or {}
+        self.columns = columns or {}
+        names = fields + tuple(self.columns)
+        self.keys = tuple(RENAMED_KEYS.get(name, camel_case(name)) for name in names)
+        self._selected = (
+            *(getattr(model, field) for field in fields),
+            *(expression.label(name) for name, (expression, _) in self.columns.items()),
+        )
+        self._converters = [
+            (len(fields) + index, self.keys[len(fields) + index], convert)
+            for index, (_, convert) in enumerate(self.columns.values())
+        ]
+
+    def select(self, *extra):
+        # The statement dump_rows() reads. Extra columns, such as a sort key
+        # the cursor needs, go after the fields and are left out of the dump.
+        names = set(self.fields) | set(self.columns)
+        return db.select(*self._selected, *(column for column in extra if column.key not in names))
+
+    def _dump_row(self, row):
+        data = dict(zip(self.keys, row))
+        for index, key, convert in self._converters:
+            data[key] = convert(row[index])
+        return data
+
+    def dump_row(self, row):
+        with metrics.phase('serialize'):
+            return self._dump_row(row)
+
+    def dump_rows(self, rows):
+        with metrics.phase('serialize'):
+            return [self._dump_row(row) for row in rows]
+
+    def dump(self, obj):
+        with metrics.phase('serialize'):
+            data = {key: getattr(obj, field) for key, field in zip(self.keys, self.fields)}
+            for name, getter in self.computed.items():
+                data[camel_case(name)] = getter(obj)
+            return data
+
+
+user_schema = Schema(
+    User,
+    ('id', 'username', 'email', 'profile_picture', 'is_admin', 'created_at', 'updated_at'),
+)
+
+# What anyone may see of a user. The email and admin flag are only sent to
+# the user themselves and to admins, through user_schema.
+public_profile_schema = Schema(
+    User,
+    ('id', 'username', 'profile_picture', 'created_at'),
+)
+
+post_schema = Schema(
+    Post,
+    ('id', 'user_id', 'title', 'content', 'image', 'category', 'slug', 'engagement', 'created_at', 'updated_at'),
+)
+
+comment_schema = Schema(
+    Comment,
+    ('id', 'content', 'post_id', 'user_id', 'parent_id', 'number_of_likes', 'created_at', 'updated_at'),
+    computed={'likes': lambda comment: [like.user_id for like in comment.like_rows]},
+    # One lookup of the (comment_id, user_id) primary key per comment.
+    columns={'likes': (
+        db.select(db.func.aggregate_strings(db.cast(CommentLike.user_id, db.String), ','))
+        .where(CommentLike.comment_id == Comment.id)
+        .scalar_subquery(),
+        _ids,
+    )},
+)
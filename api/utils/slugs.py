@@ -0,0 +1,107 @@
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from models import db, Post
+
+SLUG_MAX_LENGTH = 100
+_NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+
+def slugify(title):
+    value = unicodedata.normalize('NFKD', title or '').encode('ascii', 'ignore').decode('ascii')
+    value = _NON_WORD_RE.sub('-', value.lower()).strip('-')
+    # Leave room for a '-<n>' collision suffix.
+    return value[:SLUG_MAX_LENGTH - 8].strip('-') or 'post'
+
+
+def unique_slugs(titles, reserved=()):
+    # Slugs for a batch of titles, unique among themselves, against the
+    # posts table and against `reserved`, looked up with two queries for the
+    # whole batch.
+    bases = [slugify(title) for title in titles]
+    distinct = set(bases)
+    taken = set(reserved)
+    taken.update(db.session.scalars(db.select(Post.slug).where(Post.slug.in_(distinct))))
+
+    seen = set()
+    collided = set()
+    for base in bases:
+        if base in taken or base in seen:
+            collided.add(base)
+        seen.add(base)
+
+    if collided:
+        taken.update(db.session.scalars(db.select(Post.slug).where(
+            db.or_(*(Post.slug.like(f'{base}-%') for base in collided))
+        )))
+
+    slugs = []
+    for base in bases:
+        slug = base
+        suffix = 2
+        while slug in taken:
+            slug = f'{base}-{suffix}'
+            suffix += 1
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+class PostCache:
+    # Bounded LRU of slug -> the post's JSON body and ETag, so serving an
+    # article is a dict lookup. Entries are dropped when the post is updated
+    # or deleted in this process; the TTL bounds how stale other processes,
+    # and counters such as engagement, can get.
+
+    def __init__(self, max_entries=2048, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('POST_CACHE_SIZE', self.max_entries)
+        self.ttl = app.config.get('POST_CACHE_TTL', self.ttl)
+
+    def get(self, slug):
+        with self._lock:
+            entry = self._entries.get(slug)
+            if entry is None:
+                return None
+            body, etag, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[slug]
+                return None
+            self._entries.move_to_end(slug)
+            return body, etag
+
+    def set(self, slug, body, generation):
+        # generation is the value read before loading the post. If anything
+        # was invalidated since, the body may predate that write and is
+        # returned without being stored.
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        with self._lock:
+            if generation == self.generation and self.max_entries > 0:
+                self._entries[slug] = (body, etag, time.monotonic() + self.ttl)
+                self._entries.move_to_end(slug)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return body, etag
+
+    def invalidate(self, *slugs):
+        with self._lock:
+            self.generation += 1
+            for slug in slugs:
+                self._entries.pop(slug, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+
+post_cache = PostCache()
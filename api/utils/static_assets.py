@@ -0,0 +1,137 @@
+import gzip
+import mimetypes
+import os
+import re
+from flask import request, send_file
+from utils.error import error_handler
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional, gzip is always available
+    brotli = None
+
+# Vite puts content-hashed bundles under assets/, e.g. assets/index-4f3a2b1c.js.
+HASHED_ASSET_RE = re.compile(r'^assets/.+[-.][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'public, no-cache'
+# Preferred order when the client accepts several encodings equally.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/xml')
+MIN_COMPRESS_SIZE = 1024
+
+
+class Asset:
+    __slots__ = ('path', 'mimetype', 'etag', 'immutable', 'variants')
+
+    def __init__(self, path, mimetype, etag, immutable, variants):
+        self.path = path
+        self.mimetype = mimetype
+        self.etag = etag
+        self.immutable = immutable
+        # encoding -> (path, etag)
+        self.variants = variants
+
+
+def _etag(stat):
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+
+def build_manifest(root):
+    # Maps every file under root, by its URL path, to an Asset. Compressed
+    # siblings (app.js.br, app.js.gz) become variants of the original rather
+    # than assets of their own, and are ignored if older than it.
+    manifest = {}
+    if not os.path.isdir(root):
+        return manifest
+    suffixes = tuple(suffix for _, suffix in ENCODINGS)
+    for directory, _, files in os.walk(root):
+        names = set(files)
+        for name in files:
+            if name.endswith(suffixes):
+                continue
+            path = os.path.join(directory, name)
+            stat = os.stat(path)
+            variants = {}
+            for encoding, suffix in ENCODINGS:
+                if name + suffix in names:
+                    variant_stat = os.stat(path + suffix)
+                    if variant_stat.st_mtime_ns >= stat.st_mtime_ns:
+                        variants[encoding] = (path + suffix, f'{_etag(stat)}-{encoding}')
+            url_path = os.path.relpath(path, root).replace(os.sep, '/')
+            mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            manifest[url_path] = Asset(path, mimetype, _etag(stat), bool(HASHED_ASSET_RE.match(url_path)), variants)
+    return manifest
+
+
+def compress_assets(root, min_size=MIN_COMPRESS_SIZE):
+    # Writes .gz, and .br when brotli is installed, next to each text asset
+    # that lacks an up-to-date one. Returns the number of files written.
+    written = 0
+    for url_path, asset in build_manifest(root).items():
+        if not asset.mimetype.startswith(COMPRESSIBLE_TYPES) or os.path.getsize(asset.path) < min_size:
+            continue
+        with open(asset.path, 'rb') as f:
+            data = f.read()
+        for encoding, suffix in ENCODINGS:
+            if encoding in asset.variants:
+                continue
+            if encoding == 'br':
+                if brotli is None:
+                    continue
+                compressed = brotli.compress(data, quality=11)
+            else:
+                compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) >= len(data):
+                continue
+            with open(asset.path + suffix, 'wb') as f:
+                f.write(compressed)
+            written += 1
+    return written
+
+
+class StaticAssets:
+    # Serves the built client from a manifest made once at startup, so a
+    # request costs a dict lookup instead of filesystem checks. Picks the
+    # best precompressed variant the client accepts, lets hashed bundles be
+    # cached forever and answers conditional requests with 304s. Rebuilding
+    # the client needs a restart to be picked up.
+
+    def __init__(self):
+        self.root = None
+        self.manifest = {}
+
+    def init_app(self, app):
+        self.root = os.path.abspath(app.config['STATIC_ROOT'])
+        self.manifest = build_manifest(self.root)
+
+    def _choose(self, asset):
+        accepted = request.accept_encodings
+        best, best_quality = None, 0
+        for encoding, _ in ENCODINGS:
+            quality = accepted[encoding]
+            if encoding in asset.variants and quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def serve(self, path):
+        asset = self.manifest.get(path)
+        if asset is None:
+            if path.startswith('api/') or '.' in path.rsplit('/', 1)[-1]:
+                # A missing file or API route, not a client-side route.
+                return error_handler(404, 'Not found')
+            asset = self.manifest.get('index.html')
+            if asset is None:
+                return error_handler(404, 'Not found')
+
+        encoding = self._choose(asset)
+        file_path, etag = asset.variants[encoding] if encoding else (asset.path, asset.etag)
+        response = send_file(file_path, mimetype=asset.mimetype, etag=etag, conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE if asset.immutable else REVALIDATE_CACHE
+        return response
+
+
+static_assets = StaticAssets()
@@ -0,0 +1,131 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, User, Post, Comment
+
+TRACKED_MODELS = (User, Post, Comment)
+
+# Keep a little more than the 30 day dashboard window so callers using local
+# time instead of UTC for their cutoff are still answered from memory.
+RECENT_WINDOW = timedelta(days=32)
+
+
+class _Counter:
+    __slots__ = ('total', 'recent', 'window_start', 'reconciled_at')
+
+    def __init__(self, total, recent, window_start):
+        self.total = total
+        self.recent = recent
+        self.window_start = window_start
+        self.reconciled_at = time.monotonic()
+
+
+class StatsStore:
+    # Row totals and sorted recent created_at values per model, updated from
+    # committed session changes and reloaded from the database every
+    # STATS_RECONCILE_INTERVAL seconds to pick up writes from other workers.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def total(self, model):
+        counter = self._counter(model)
+        with self._lock:
+            return counter.total
+
+    def last_month(self, model, since):
+        counter = self._counter(model)
+        if since < counter.window_start:
+            return model.query.filter(model.created_at >= since).count()
+        with self._lock:
+            return len(counter.recent) - bisect_left(counter.recent, since)
+
+    def is_fresh(self, model):
+        # Whether total() and last_month() can answer without a query.
+        interval = current_app.config.get('STATS_RECONCILE_INTERVAL', 300)
+        with self._lock:
+            counter = self._counters.get(model)
+            return counter is not None and time.monotonic() - counter.reconciled_at < interval
+
+    def invalidate(self, model=None):
+        with self._lock:
+            if model is None:
+                self._counters.clear()
+            else:
+                self._counters.pop(model, None)
+
+    def apply(self, changes):
+        with self._lock:
+            for model, created_at, delta in changes:
+                counter = self._counters.get(model)
+                if counter is None:
+                    continue
+                counter.total += delta
+                if created_at is None:
+                    # Unknown timestamp for a deleted row; reload on next read.
+                    self._counters.pop(model)
+                elif created_at >= counter.window_start:
+                    if delta > 0:
+                        insort(counter.recent, created_at)
+                    else:
+                        index = bisect_left(counter.recent, created_at)
+                        if index < len(counter.recent) and counter.recent[index] == created_at:
+                            del counter.recent[index]
+
+    def _counter(self, model):
+        interval = current_app.config.get('STATS_RECONCILE_INTERVAL', 300)
+        with self._lock:
+            counter = self._counters.get(model)
+            if counter is not None and time.monotonic() - counter.reconciled_at < interval:
+                return counter
+
+        counter = self._load(model)
+        with self._lock:
+            self._counters[model] = counter
+        return counter
+
+    def _load(self, model):
+        window_start = datetime.utcnow() - RECENT_WINDOW
+        total = db.session.query(db.func.count(model.id)).scalar()
+        recent = [
+            created_at for (created_at,) in
+            db.session.query(model.created_at).filter(model.created_at >= window_start).order_by(model.created_at)
+        ]
+        return _Counter(total, recent, window_start)
+
+
+stats = StatsStore()
+
+
+def _created_at(obj):
+    value = obj.__dict__.get('created_at')
+    return value if isinstance(value, datetime) else None
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    changes = session.info.setdefault('stats_changes', [])
+    for obj in session.new:
+        if isinstance(obj, TRACKED_MODELS):
+            # created_at is filled in by CURRENT_TIMESTAMP, which is UTC.
+            changes.append((type(obj), _created_at(obj) or datetime.utcnow(), 1))
+    for obj in session.deleted:
+        if isinstance(obj, TRACKED_MODELS):
+            changes.append((type(obj), _created_at(obj), -1))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop('stats_changes', None)
+    if changes:
+        stats.apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('stats_changes', None)
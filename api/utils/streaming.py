@@ -0,0 +1,23 @@
+from flask import Response, current_app, stream_with_context
+
+STREAM_CHUNK_ROWS = 100
+# Rows fetched from the cursor at a time for streamed listings.
+STREAM_BATCH_SIZE = 500
+
+
+def stream_listing(key, rows, serialize, **fields):
+    # Streams {**fields, key: [serialize(row), ...]} as rows come off the
+    # cursor instead of building the whole list and JSON string in memory.
+    def generate():
+        dumps = current_app.json.dumps
+        head = dumps(fields)[:-1]
+        yield f'{head}{"," if fields else ""}"{key}":['
+        chunk = []
+        for index, row in enumerate(rows):
+            chunk.append(('' if index == 0 else ',') + dumps(serialize(row)))
+            if len(chunk) >= STREAM_CHUNK_ROWS:
+                yield ''.join(chunk)
+                chunk = []
+        yield ''.join(chunk) + ']}\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
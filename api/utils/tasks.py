@@ -0,0 +1,85 @@
+from models import db, Comment, CommentLike, COMMENT_PATH_DIGITS
+from utils.jobs import job
+from utils.stats import stats
+from utils.cache import response_cache
+from utils.threads import branch_condition
+from utils.ranking import refresh_posts, rescore_comments
+
+DELETE_BATCH_SIZE = 500
+
+
+def _invalidate(*namespaces):
+    # Only takes effect in the web workers when the job runs in them
+    # (JOB_QUEUE_EAGER) or the response cache is shared
+    # (RESPONSE_CACHE_BACKEND=redis). Otherwise jobs run in the jobs-worker
+    # process and the web workers' listings stay cached until
+    # RESPONSE_CACHE_TTL runs out.
+    response_cache.invalidate(*namespaces)
+
+
+def _delete_comments_in_batches(condition):
+    # Deletes matching comments and their likes a batch at a time, committing
+    # between batches so the write lock is never held for long, then
+    # recounts the engagement of the posts they were on.
+    post_ids = set()
+    while True:
+        rows = db.session.execute(db.select(Comment.id, Comment.post_id).where(condition).limit(DELETE_BATCH_SIZE)).all()
+        if not rows:
+            break
+        ids = [row_id for row_id, _ in rows]
+        post_ids.update(post_id for _, post_id in rows)
+        db.session.execute(db.delete(CommentLike).where(CommentLike.comment_id.in_(ids)))
+        db.session.execute(db.delete(Comment).where(Comment.id.in_(ids)))
+        db.session.commit()
+    if post_ids:
+        refresh_posts(post_ids)
+        db.session.commit()
+    # Likewise only this process's totals; other processes correct theirs at
+    # the next stats reconcile.
+    stats.invalidate(Comment)
+    _invalidate('comments', 'posts')
+
+
+@job('delete_post_comments')
+def delete_post_comments(post_id):
+    _delete_comments_in_batches(Comment.post_id == post_id)
+
+
+@job('delete_comment_branch')
+def delete_comment_branch(post_id, prefix):
+    # The replies below a deleted comment, found by their path prefix.
+    _delete_comments_in_batches(branch_condition(post_id, prefix))
+
+
+@job('delete_user_content')
+def delete_user_content(user_id):
+    # The comments the user liked lose a like each, so they and their posts
+    # are recounted once the likes are gone.
+    liked = db.session.scalars(db.select(CommentLike.comment_id).where(CommentLike.user_id == user_id)).all()
+    db.session.execute(db.delete(CommentLike).where(CommentLike.user_id == user_id))
+    db.session.commit()
+    for start in range(0, len(liked), DELETE_BATCH_SIZE):
+        recount_comment_likes(liked[start:start + DELETE_BATCH_SIZE])
+    # Replies to the user's comments go with them, as when a comment is deleted.
+    replies = db.aliased(Comment)
+    branches = db.session.execute(
+        db.select(Comment.post_id, Comment.path, Comment.id)
+        .where(Comment.user_id == user_id, db.exists().where(replies.parent_id == Comment.id))
+    ).all()
+    for post_id, path, comment_id in branches:
+        _delete_comments_in_batches(branch_condition(post_id, path + str(comment_id).zfill(COMMENT_PATH_DIGITS)))
+    _delete_comments_in_batches(Comment.user_id == user_id)
+
+
+@job('recount_comment_likes')
+def recount_comment_likes(comment_ids):
+    counts = (
+        db.select(db.func.count())
+        .where(CommentLike.comment_id == Comment.id)
+        .scalar_subquery()
+    )
+    db.session.execute(db.update(Comment).where(Comment.id.in_(comment_ids)).values(number_of_likes=counts))
+    rescore_comments(comment_ids)
+    refresh_posts(db.session.scalars(db.select(Comment.post_id).where(Comment.id.in_(comment_ids)).distinct()).all())
+    db.session.commit()
+    _invalidate('comments', 'posts')
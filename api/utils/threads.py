@@ -0,0 +1,121 @@
+from models import db, Comment, COMMENT_MAX_DEPTH
+from utils.pagination import keyset_statement, finish_keyset_page
+from utils.serializers import comment_schema
+
+THREAD_PAGE_SIZE = 10
+REPLIES_PER_THREAD = 3
+MAX_REPLIES_PER_THREAD = 20
+BRANCH_LIMIT = 200
+
+
+class InvalidParent(ValueError):
+    pass
+
+
+def reply_path(post_id, parent_id):
+    # The path for a new comment on post_id replying to parent_id (or None).
+    # Replies past the maximum depth are attached to the parent's parent,
+    # so deep chains keep going without making the path any longer.
+    if parent_id is None:
+        return None, ''
+    parent = db.session.get(Comment, parent_id)
+    if parent is None or parent.post_id != post_id:
+        raise InvalidParent('Parent comment not found on this post')
+    if parent.depth + 1 >= COMMENT_MAX_DEPTH:
+        return parent.parent_id, parent.path
+    return parent.id, parent.branch_path
+
+
+def branch_condition(post_id, prefix):
+    # Every comment whose path starts with prefix, as a range on the
+    # (post_id, path) index. Paths are all digits and ':' sorts after '9'.
+    return db.and_(Comment.post_id == post_id, Comment.path >= prefix, Comment.path < prefix + ':')
+
+
+def _reply_counts(ids):
+    if not ids:
+        return {}
+    rows = db.session.execute(
+        db.select(Comment.parent_id, db.func.count()).where(Comment.parent_id.in_(ids)).group_by(Comment.parent_id)
+    )
+    return dict(rows.all())
+
+
+def _dump(row, counts):
+    data = comment_schema.dump_row(row)
+    data['replyCount'] = counts.get(row.id, 0)
+    return data
+
+
+def thread_page(post_id, cursor, limit, replies):
+    # One page of a post's top-level comments, newest first, each with its
+    # first `replies` replies, oldest first. At most three queries whatever
+    # the page size: the page, the replies of every thread, and the reply
+    # counts.
+    query = comment_schema.select().where(
+        Comment.post_id == post_id, Comment.parent_id.is_(None)
+    )
+    page = keyset_statement(query, 'created_at', Comment.created_at, Comment.id, True, cursor, limit)
+    threads, next_cursor = finish_keyset_page(db.session.execute(page).all(), 'created_at', Comment.created_at, limit)
+
+    children = []
+    thread_ids = [thread.id for thread in threads]
+    if thread_ids and replies > 0:
+        # The first replies of every thread in one statement, each thread's
+        # taken from the (parent_id, created_at, id) index by a correlated
+        # LIMIT rather than by ranking all of its replies.
+        sibling = db.aliased(Comment)
+        first = (
+            db.select(sibling.id).where(sibling.parent_id == Comment.parent_id)
+            .order_by(sibling.created_at, sibling.id).limit(replies)
+        )
+        children = db.session.execute(
+            comment_schema.select()
+            .where(Comment.parent_id.in_(thread_ids), Comment.id.in_(first))
+            .order_by(Comment.parent_id, Comment.created_at, Comment.id)
+        ).all()
+
+    counts = _reply_counts(thread_ids + [child.id for child in children])
+    by_parent = {}
+    for child in children:
+        by_parent.setdefault(child.parent_id, []).append(_dump(child, counts))
+    comments = []
+    for thread in threads:
+        data = _dump(thread, counts)
+        data['replies'] = by_parent.get(thread.id, [])
+        comments.append(data)
+    return comments, next_cursor
+
+
+def replies_page(comment, cursor, limit):
+    # The direct replies of a comment, oldest first, from the
+    # (parent_id, created_at, id) index.
+    query = comment_schema.select().where(Comment.parent_id == comment.id)
+    page = keyset_statement(query, 'created_at', Comment.created_at, Comment.id, False, cursor, limit)
+    rows, next_cursor = finish_keyset_page(db.session.execute(page).all(), 'created_at', Comment.created_at, limit)
+    counts = _reply_counts([row.id for row in rows])
+    return [_dump(row, counts) for row in rows], next_cursor
+
+
+def branch(comment, limit):
+    # Up to `limit` comments below this one, nested under their parents.
+    # One range scan of the (post_id, path) index: direct replies come
+    # first, then each reply's own branch in turn.
+    rows = db.session.execute(
+        comment_schema.select()
+        .where(branch_condition(comment.post_id, comment.branch_path))
+        .order_by(Comment.path, Comment.id)
+        .limit(limit + 1)
+    ).all()
+    truncated = len(rows) > limit
+    rows = rows[:limit]
+    counts = _reply_counts([row.id for row in rows])
+    nodes = {comment.id: {'replies': []}}
+    for row in rows:
+        data = nodes[row.id] = _dump(row, counts)
+        data['replies'] = []
+    for row in rows:
+        parent = nodes.get(row.parent_id)
+        if parent is not None:
+            parent['replies'].append(nodes[row.id])
+    return nodes[comment.id]['replies'], truncated
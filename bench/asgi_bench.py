@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from models import db
+from load_suite import create_app, summarize
+from seed_data import seed
+
+SCALE = os.environ.get('BENCH_SCALE', 'small')
+CONNECTIONS = [int(n) for n in os.environ.get('BENCH_CONNECTIONS', '16,128,512').split(',')]
+DURATION = float(os.environ.get('BENCH_SECONDS', 10))
+MODES = os.environ.get('BENCH_MODES', 'wsgi,asgi-sync,asgi').split(',')
+OUTPUT = os.environ.get('BENCH_OUTPUT')
+# Uncached reads, so every request reaches the database.
+APP_CONFIG = {'RESPONSE_CACHE_TTL': 0}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _serve(mode, database_url, workdir, port):
+    # wsgi: the threaded werkzeug server app.run uses. asgi-sync: uvicorn
+    # with every request going through the Flask app on a thread pool.
+    # asgi: uvicorn with the async read handlers.
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = create_app(database_url, workdir, **APP_CONFIG)
+    if mode == 'wsgi':
+        from werkzeug.serving import make_server
+        make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+        return
+
+    import uvicorn
+    from a2wsgi import WSGIMiddleware
+    from utils.asgi import AsyncReadApp
+    application = AsyncReadApp(app) if mode == 'asgi' else WSGIMiddleware(app, workers=10)
+    uvicorn.run(application, host='127.0.0.1', port=port, log_level='warning', backlog=4096,
+                lifespan='on' if mode == 'asgi' else 'off')
+
+
+def _wait_for(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+async def _client(port, paths, deadline, samples, rng):
+    # A keep-alive HTTP/1.1 client that reconnects when the server closes
+    # the connection, as HTTP/1.0 servers do after every response.
+    reader = writer = None
+    while time.time() < deadline:
+        path = rng.choice(paths)()
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: bench\r\nConnection: keep-alive\r\n\r\n'.encode())
+            head = await reader.readuntil(b'\r\n\r\n')
+            lines = head.decode('latin-1').split('\r\n')
+            status = int(lines[0].split()[1])
+            fields = {name.lower(): value.strip() for name, _, value in (line.partition(':') for line in lines[1:] if line)}
+            if 'content-length' in fields:
+                await reader.readexactly(int(fields['content-length']))
+            else:
+                await reader.read()
+            if fields.get('connection', '').lower() == 'close' or lines[0].startswith('HTTP/1.0') or 'content-length' not in fields:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            if writer is not None:
+                writer.close()
+            writer = None
+            status = None
+        samples.append((status, time.perf_counter() - start, None))
+    if writer is not None:
+        writer.close()
+
+
+async def _load(port, connections, fx):
+    rng = random.Random(connections)
+    paths = [
+        lambda: f'/api/post/getposts?limit=9&order=desc&startIndex={rng.randrange(0, 900, 9)}',
+        lambda: f'/api/post/getposts?postId={rng.randint(1, fx["posts"])}',
+        lambda: f'/api/comment/getPostComments/{rng.randint(1, fx["posts"])}',
+    ]
+    samples = []
+    deadline = time.time() + DURATION
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(port, paths, deadline, samples, rng) for _ in range(connections)))
+    return summarize(samples, time.perf_counter() - started)
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    database_url = f'sqlite:///{os.path.join(workdir, "bench.db")}'
+    app = create_app(database_url, workdir)
+    with app.app_context():
+        db.create_all()
+        dataset = seed(SCALE)
+        for engine in db.engines.values():
+            engine.dispose()
+    print(f'Seeded {dataset}', file=sys.stderr)
+
+    report = {'dataset': dataset, 'seconds': DURATION, 'modes': {}}
+    for mode in MODES:
+        port = _free_port()
+        server = multiprocessing.Process(target=_serve, args=(mode, database_url, workdir, port), daemon=True)
+        server.start()
+        try:
+            _wait_for(port)
+            results = report['modes'][mode] = {}
+            for connections in CONNECTIONS:
+                result = results[connections] = asyncio.run(_load(port, connections, dataset))
+                print(f'{mode:10} {connections:5} connections  {result["throughput_rps"]:8.1f} req/s  '
+                      f'p50 {result["p50_ms"]:8.2f} ms  p99 {result["p99_ms"]:8.2f} ms  '
+                      f'errors {result["errors"]}  {result["statuses"]}', file=sys.stderr)
+        finally:
+            server.terminate()
+            server.join()
+
+    output = json.dumps(report, indent=2)
+    if OUTPUT:
+        with open(OUTPUT, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+import jwt
+from flask import Flask
+from models import db, User
+from utils.auth import current_claims, current_user, issue_token, token_cache, ALGORITHM
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', 20000))
+# Typical number of auth lookups made while serving one request.
+LOOKUPS_PER_REQUEST = 3
+
+
+def per_request_us(app, headers, handler):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        with app.test_request_context('/', headers=headers):
+            handler()
+    return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+
+def main():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['JWT_SECRET'] = 'bench-secret-bench-secret-bench-secret'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        user = User(username='benchuser', email='bench@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        with app.test_request_context('/'):
+            token = issue_token(user)
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def empty():
+        pass
+
+    def uncached():
+        # What each call site did before: verify the HMAC and load the user.
+        for _ in range(LOOKUPS_PER_REQUEST):
+            claims = jwt.decode(token, 'bench-secret-bench-secret-bench-secret', algorithms=[ALGORITHM])
+            db.session.get(User, int(claims['id']), populate_existing=True)
+        db.session.remove()
+
+    def cached():
+        for _ in range(LOOKUPS_PER_REQUEST):
+            current_claims()
+            current_user()
+        db.session.remove()
+
+    baseline = per_request_us(app, headers, empty)
+    before = per_request_us(app, headers, uncached) - baseline
+    token_cache.clear()
+    after = per_request_us(app, headers, cached) - baseline
+    print(f'request context overhead  {baseline:8.1f} us')
+    print(f'auth before               {before:8.1f} us/request')
+    print(f'auth after                {after:8.1f} us/request')
+
+
+if __name__ == '__main__':
+    main()
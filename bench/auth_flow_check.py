@@ -0,0 +1,66 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from models import db
+from load_suite import create_app
+from utils.auth import TOKEN_COOKIE
+
+EMAIL = 'flowcheck@example.com'
+PASSWORD = 'flow-check-password'
+
+
+def token_from(response):
+    # The value of the token cookie the response sets, or None.
+    for header in response.headers.getlist('Set-Cookie'):
+        name, _, rest = header.partition('=')
+        if name == TOKEN_COOKIE:
+            return rest.split(';', 1)[0] or None
+    return None
+
+
+def main():
+    # Signs up and in, makes authenticated requests with the cookie and the
+    # bearer header, signs out, then checks the token is refused from then
+    # on. Exits non-zero if any step does not get the expected status.
+    failures = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        app = create_app(f'sqlite:///{os.path.join(workdir, "check.db")}', workdir, BCRYPT_ROUNDS=4, PASSWORD_HASH_WORKERS=0)
+        with app.app_context():
+            db.create_all()
+        client = app.test_client()
+
+        def check(label, response, expected):
+            nonlocal failures
+            ok = response.status_code == expected
+            failures += not ok
+            print(f'{"ok  " if ok else "FAIL"} {label:44} {response.status_code} (expected {expected})')
+            return response
+
+        check('signup', client.post('/api/auth/signup', json={'username': 'flowcheck', 'email': EMAIL, 'password': PASSWORD}), 200)
+        check('signin with a wrong password', client.post('/api/auth/signin', json={'email': EMAIL, 'password': 'wrong'}), 400)
+        signin = check('signin', client.post('/api/auth/signin', json={'email': EMAIL, 'password': PASSWORD}), 200)
+        token = token_from(signin)
+        if token is None:
+            print('FAIL signin did not set the token cookie')
+            sys.exit(1)
+        user_id = signin.get_json()['_id']
+        bearer = {'Authorization': f'Bearer {token}'}
+
+        check('update without a token', app.test_client().put(f'/api/user/update/{user_id}', json={}), 401)
+        check('update with the cookie', client.put(f'/api/user/update/{user_id}', json={}), 200)
+        check('update with the bearer header', app.test_client().put(f'/api/user/update/{user_id}', json={}, headers=bearer), 200)
+        check('update of another user', client.put(f'/api/user/update/{user_id + 1}', json={}), 403)
+        check('signout', client.post('/api/user/signout'), 200)
+        check('update after signout', client.put(f'/api/user/update/{user_id}', json={}), 401)
+        check('revoked token in the bearer header', app.test_client().put(f'/api/user/update/{user_id}', json={}, headers=bearer), 401)
+        signin = check('signin again', client.post('/api/auth/signin', json={'email': EMAIL, 'password': PASSWORD}), 200)
+        check('update with the new token', client.put(f'/api/user/update/{user_id}', json={}), 200)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from flask import Flask
+from models import db, User
+from utils.bulk import import_ndjson, export_ndjson
+
+
+def generate_posts(count, users):
+    for i in range(count):
+        yield json.dumps({
+            'title': f'Imported post number {i}',
+            'content': 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 20,
+            'category': ('tech', 'life', 'travel')[i % 3],
+            'userId': i % users + 1,
+        }) + '\n'
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp}/bulk.db'
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            db.session.add_all([
+                User(username=f'user{i}', email=f'user{i}@example.com', password_hash='x') for i in range(100)
+            ])
+            db.session.commit()
+
+            start = time.perf_counter()
+            inserted, skipped = import_ndjson('posts', generate_posts(count, 100))
+            elapsed = time.perf_counter() - start
+            print(f'import  {inserted} posts ({skipped} skipped) in {elapsed:.1f}s '
+                  f'= {inserted / elapsed:.0f} rows/s, peak RSS {peak_rss_mb():.0f} MB')
+
+            start = time.perf_counter()
+            exported = sum(1 for _ in export_ndjson('posts'))
+            elapsed = time.perf_counter() - start
+            print(f'export  {exported} posts in {elapsed:.1f}s '
+                  f'= {exported / elapsed:.0f} rows/s, peak RSS {peak_rss_mb():.0f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+from config import engine_options
+from models import db, User, Post, Comment
+from utils.database import configure_engine
+
+THREADS = int(os.environ.get('BENCH_THREADS', 16))
+DURATION = float(os.environ.get('BENCH_SECONDS', 5))
+WRITE_RATIO = 0.1
+
+
+def seed(engine):
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x'} for i in range(50)
+        ])
+        conn.execute(insert(Post.__table__), [
+            {'user_id': i % 50 + 1, 'title': f'Post {i}', 'content': 'Lorem ipsum ' * 50, 'slug': f'post-{i}'}
+            for i in range(2000)
+        ])
+
+
+def worker(engine, index, stop, results):
+    reads = writes = errors = 0
+    latencies = []
+    posts = Post.__table__
+    comments = Comment.__table__
+    page = select(posts.c.id, posts.c.title).order_by(posts.c.created_at.desc(), posts.c.id.desc()).limit(9)
+    counter = 0
+    while not stop.is_set():
+        counter += 1
+        start = time.perf_counter()
+        try:
+            if counter % int(1 / WRITE_RATIO) == 0:
+                with engine.begin() as conn:
+                    conn.execute(insert(comments).values(content='bench', post_id=counter % 2000 + 1, user_id=index % 50 + 1))
+                writes += 1
+            else:
+                with engine.connect() as conn:
+                    conn.execute(page).all()
+                reads += 1
+        except OperationalError:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    results.append((reads, writes, errors, latencies))
+
+
+def run(label, engine):
+    seed(engine)
+    stop = threading.Event()
+    results = []
+    threads = [threading.Thread(target=worker, args=(engine, i, stop, results)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    reads = sum(r[0] for r in results)
+    writes = sum(r[1] for r in results)
+    errors = sum(r[2] for r in results)
+    latencies = sorted(l for r in results for l in r[3])
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    print(f'{label:8} {(reads + writes) / DURATION:9.0f} ops/s  reads {reads:7}  writes {writes:6}  '
+          f'errors {errors:5}  p99 {p99:7.2f} ms')
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        before_url = f'sqlite:///{tmp}/before.db'
+        run('before', create_engine(before_url))
+
+        after_url = f'sqlite:///{tmp}/after.db'
+        after = create_engine(after_url, **engine_options(after_url))
+        configure_engine(after)
+        run('after', after)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from utils.jobs import JobQueue, job
+
+JOBS = int(os.environ.get('BENCH_JOBS', 20000))
+processed = []
+
+
+@job('bench_noop')
+def bench_noop(index):
+    processed.append(index)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = JobQueue(os.path.join(tmp, 'jobs.db'))
+
+        start = time.perf_counter()
+        for index in range(JOBS):
+            queue.enqueue('bench_noop', {'index': index}, idempotency_key=f'bench:{index}')
+        elapsed = time.perf_counter() - start
+        print(f'enqueue            {JOBS / elapsed:9.0f} jobs/s')
+
+        start = time.perf_counter()
+        for index in range(0, JOBS, 10):
+            queue.enqueue('bench_noop', {'index': index}, idempotency_key=f'bench:{index}')
+        elapsed = time.perf_counter() - start
+        print(f'duplicate enqueue  {JOBS / 10 / elapsed:9.0f} jobs/s  (counts {queue.counts()})')
+
+        for batch in (1, 10, 100):
+            processed.clear()
+            queue._conn().execute("UPDATE jobs SET status = 'queued', attempts = 0")
+            start = time.perf_counter()
+            while queue.run_one_batch(batch):
+                pass
+            elapsed = time.perf_counter() - start
+            print(f'work batch={batch:<4}    {len(processed) / elapsed:9.0f} jobs/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from models import db, User, Comment, CommentLike
+from load_suite import create_app
+from seed_data import seed
+from utils.auth import issue_token
+from utils.like_buffer import like_buffer
+
+THREADS = int(os.environ.get('BENCH_THREADS', 16))
+DURATION = float(os.environ.get('BENCH_SECONDS', 5))
+# Likes go to a handful of comments, as when one goes viral.
+HOT_COMMENTS = int(os.environ.get('BENCH_HOT_COMMENTS', 3))
+
+
+def worker(app, tokens, stop, results, index):
+    rng = random.Random(index)
+    client = app.test_client()
+    latencies = []
+    errors = 0
+    while not stop.is_set():
+        headers = {'Authorization': 'Bearer ' + rng.choice(tokens)}
+        start = time.perf_counter()
+        response = client.put(f'/api/comment/likeComment/{rng.randint(1, HOT_COMMENTS)}', headers=headers)
+        latencies.append(time.perf_counter() - start)
+        errors += response.status_code != 200
+    results.append((latencies, errors))
+
+
+def run(label, buffered, workdir):
+    database_url = f'sqlite:///{os.path.join(workdir, label + ".db")}'
+    app = create_app(database_url, workdir, LIKE_BUFFER_ENABLED=buffered, LIKE_LOG_DIR=os.path.join(workdir, label + '-log'))
+    with app.app_context():
+        db.create_all()
+        seed('tiny')
+        users = db.session.scalars(db.select(User)).all()
+        tokens = [issue_token(user) for user in users]
+    if buffered:
+        like_buffer.init_app(app)
+
+    stop = threading.Event()
+    results = []
+    threads = [threading.Thread(target=worker, args=(app, tokens, stop, results, i)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    if buffered:
+        with app.app_context():
+            like_buffer.flush()
+        like_buffer.enabled = False
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    with app.app_context():
+        # Every count should match its rows once the buffer is flushed.
+        drift = db.session.scalar(
+            db.select(db.func.count()).select_from(Comment).where(
+                Comment.number_of_likes != db.select(db.func.count()).where(CommentLike.comment_id == Comment.id).scalar_subquery()
+            )
+        )
+    print(f'{label:9} {len(latencies) / DURATION:8.0f} likes/s  p99 {p99:7.2f} ms  errors {errors:5}  '
+          f'transactions {like_buffer.flushes if buffered else len(latencies):7}  drifted counts {drift}')
+
+
+def main():
+    with tempfile.TemporaryDirectory() as workdir:
+        run('direct', False, workdir)
+        run('buffered', True, workdir)
+
+
+if __name__ == '__main__':
+    main()
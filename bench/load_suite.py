@@ -0,0 +1,394 @@
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from flask import Flask
+from config import engine_options
+from models import db, User, Post, Comment
+from controllers.auth_controller import auth_bp
+from controllers.user_controller import user_routes
+from controllers.post_controller import post_routes
+from controllers.comment_controller import comment_routes
+from utils.auth import issue_token
+from utils.cache import response_cache
+from utils.database import configure_engine
+from utils.jobs import job_queue
+from utils.json_provider import FastJSONProvider
+from utils.passwords import password_hasher, PasswordHasherBusy
+from utils.query_counter import QueryCounter
+from seed_data import seed, BENCH_PASSWORD, CATEGORIES
+
+SCALE = os.environ.get('BENCH_SCALE', 'small')
+# Requests per route for the in-process pass, which also counts SQL.
+REQUESTS_PER_ROUTE = int(os.environ.get('BENCH_REQUESTS', 50))
+PROCESSES = int(os.environ.get('BENCH_PROCESSES', 4))
+DURATION = float(os.environ.get('BENCH_SECONDS', 10))
+# An already running server to load instead of starting one. Its database
+# must have been seeded with seed_data.py and be reachable at
+# BENCH_DATABASE_URL, and it must share BENCH_JWT_SECRET.
+TARGET_URL = os.environ.get('BENCH_URL')
+DATABASE_URL = os.environ.get('BENCH_DATABASE_URL')
+JWT_SECRET = os.environ.get('BENCH_JWT_SECRET', 'bench-secret-bench-secret-bench-secret')
+OUTPUT = os.environ.get('BENCH_OUTPUT')
+TOKEN_USERS = 100
+# Posts and comments set aside for the delete routes, so that no other
+# request is sent to a row that is already gone.
+DELETE_RESERVE = int(os.environ.get('BENCH_DELETE_RESERVE', 500))
+
+
+def create_app(database_url, workdir, **config):
+    # The blueprints with the same extensions app.py sets up.
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_url)
+    app.config['JWT_SECRET'] = JWT_SECRET
+    app.config['BCRYPT_ROUNDS'] = int(os.environ.get('BCRYPT_ROUNDS', 12))
+    app.config['JOB_QUEUE_PATH'] = os.path.join(workdir, 'jobs.db')
+    app.config.update(config)
+    password_hasher.init_app(app)
+    job_queue.init_app(app)
+    db.init_app(app)
+    response_cache.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_engine(engine)
+    app.register_error_handler(PasswordHasherBusy, lambda e: ({'success': False, 'statusCode': e.status_code, 'message': e.message}, e.status_code))
+    app.register_blueprint(user_routes, url_prefix='/api/user')
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(post_routes, url_prefix='/api/post')
+    app.register_blueprint(comment_routes, url_prefix='/api/comment')
+    return app
+
+
+def load_fixture():
+    # Plain data the request builders draw from, picklable for the workers.
+    admins = db.session.scalars(db.select(User).where(User.is_admin.is_(True)).limit(5)).all()
+    users = db.session.scalars(db.select(User).where(User.is_admin.isnot(True)).limit(TOKEN_USERS)).all()
+    titles = db.session.scalars(db.select(Post.title).limit(200)).all()
+    words = sorted({word.lower() for title in titles for word in title.split() if len(word) > 4 and word.isalpha()})
+    post_ids = db.session.scalars(db.select(Post.id).order_by(Post.id)).all()
+    reserved = min(DELETE_RESERVE, len(post_ids) // 2)
+    post_ids, deletable_post_ids = post_ids[:len(post_ids) - reserved], post_ids[len(post_ids) - reserved:]
+    on_kept_posts = Comment.post_id <= (post_ids[-1] if post_ids else 0)
+    comment_ids = db.session.scalars(db.select(Comment.id).where(on_kept_posts).order_by(Comment.id)).all()
+    # Only comments without replies are deleted, so that deleting one never
+    # takes others along with it.
+    replies = db.aliased(Comment)
+    deletable_comment_ids = db.session.scalars(
+        db.select(Comment.id).where(on_kept_posts, ~db.exists().where(replies.parent_id == Comment.id))
+        .order_by(Comment.id.desc()).limit(min(DELETE_RESERVE, len(comment_ids) // 2))
+    ).all()
+    deletable = set(deletable_comment_ids)
+    return {
+        'admin_tokens': [issue_token(user) for user in admins],
+        'user_tokens': [issue_token(user) for user in users],
+        'emails': [user.email for user in users],
+        'user_ids': [user.id for user in users],
+        'post_ids': post_ids,
+        'comment_ids': [comment_id for comment_id in comment_ids if comment_id not in deletable],
+        # Popped by the delete routes; see share_deletable().
+        'deletable_post_ids': deletable_post_ids,
+        'deletable_comment_ids': deletable_comment_ids,
+        'search_words': words or ['lorem'],
+    }
+
+
+def share_deletable(fx, index, shares):
+    # fx with one of `shares` disjoint parts of the rows set aside for
+    # deleting, so no two passes or workers delete the same one. Share 0, the
+    # in-process pass, gets the first REQUESTS_PER_ROUTE of each.
+    fx = dict(fx)
+    for key in ('deletable_post_ids', 'deletable_comment_ids'):
+        ids = fx[key]
+        fx[key] = ids[:REQUESTS_PER_ROUTE] if index == 0 else ids[REQUESTS_PER_ROUTE:][index - 1::shares - 1]
+    return fx
+
+
+# Each builder returns (method, path, body, auth) where auth is None, 'user'
+# or 'admin'. Bodies are JSON-encoded unless already bytes. The delete
+# routes raise IndexError once their share of rows is used up.
+def _new_post(rng, fx):
+    return {'title': f'Bench post {uuid.uuid4().hex}', 'content': 'Bench content ' * 40, 'category': rng.choice(CATEGORIES)}
+
+
+def _ndjson_posts(rng, fx):
+    lines = (json.dumps({'title': f'Bench import {uuid.uuid4().hex}', 'content': 'Imported', 'userId': rng.choice(fx['user_ids'])})
+             for _ in range(20))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _ndjson_comments(rng, fx):
+    lines = (json.dumps({'content': 'Imported', 'postId': rng.choice(fx['post_ids']), 'userId': rng.choice(fx['user_ids'])})
+             for _ in range(20))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+ROUTES = {
+    # name: (weight in the HTTP mix, builder)
+    'posts.list': (20, lambda rng, fx: ('GET', f'/api/post/getposts?limit=9&order=desc&startIndex={rng.randrange(0, 90, 9)}', None, None)),
+    'posts.list_cursor': (5, lambda rng, fx: ('GET', '/api/post/getposts?limit=9&order=desc&cursor=', None, None)),
+    'posts.by_category': (8, lambda rng, fx: ('GET', f'/api/post/getposts?limit=9&order=desc&category={rng.choice(CATEGORIES)}', None, None)),
+    'posts.by_user': (5, lambda rng, fx: ('GET', f'/api/post/getposts?limit=9&userId={rng.choice(fx["user_ids"])}', None, None)),
+    'posts.by_slug': (15, lambda rng, fx: ('GET', f'/api/post/getpost/post-{rng.choice(fx["post_ids"])}', None, None)),
+    'posts.by_id': (5, lambda rng, fx: ('GET', f'/api/post/getposts?postId={rng.choice(fx["post_ids"])}', None, None)),
+    'posts.search': (5, lambda rng, fx: ('GET', f'/api/post/getposts?limit=9&searchTerm={rng.choice(fx["search_words"])}', None, None)),
+    'posts.facets': (3, lambda rng, fx: ('GET', '/api/post/facets', None, None)),
+    'posts.search_facets': (1, lambda rng, fx: ('GET', f'/api/post/facets?searchTerm={rng.choice(fx["search_words"])}', None, None)),
+    'posts.hot': (4, lambda rng, fx: ('GET', '/api/post/getposts?limit=9&sort=hot&cursor=', None, None)),
+    'posts.dashboard': (1, lambda rng, fx: ('GET', '/api/post/getposts?limit=9&order=desc&sortBy=updated_at', None, None)),
+    'posts.create': (1, lambda rng, fx: ('POST', '/api/post/create', _new_post(rng, fx), 'admin')),
+    'posts.update': (1, lambda rng, fx: ('PUT', f'/api/post/updatepost/{rng.choice(fx["post_ids"])}', _new_post(rng, fx), 'admin')),
+    'posts.delete': (0.2, lambda rng, fx: ('DELETE', f'/api/post/deletepost/{fx["deletable_post_ids"].pop()}', None, 'admin')),
+    'posts.import': (0.1, lambda rng, fx: ('POST', '/api/post/import', _ndjson_posts(rng, fx), 'admin')),
+    'posts.export': (0.05, lambda rng, fx: ('GET', '/api/post/export', None, 'admin')),
+    'comments.for_post': (20, lambda rng, fx: ('GET', f'/api/comment/getPostComments/{rng.choice(fx["post_ids"])}', None, None)),
+    'comments.top': (4, lambda rng, fx: ('GET', f'/api/comment/getPostComments/{rng.choice(fx["post_ids"])}?sort=top&limit=20', None, None)),
+    'comments.threads': (4, lambda rng, fx: ('GET', f'/api/comment/getPostThreads/{rng.choice(fx["post_ids"])}', None, None)),
+    'comments.admin_list': (1, lambda rng, fx: ('GET', '/api/comment/getcomments?limit=9&sort=desc', None, 'admin')),
+    'comments.create': (4, lambda rng, fx: ('POST', '/api/comment/create', {'content': 'Bench comment', 'postId': rng.choice(fx['post_ids'])}, 'user')),
+    'comments.like': (6, lambda rng, fx: ('PUT', f'/api/comment/likeComment/{rng.choice(fx["comment_ids"])}', None, 'user')),
+    'comments.edit': (1, lambda rng, fx: ('PUT', f'/api/comment/editComment/{rng.choice(fx["comment_ids"])}', {'content': 'Edited'}, 'admin')),
+    'comments.delete': (0.5, lambda rng, fx: ('DELETE', f'/api/comment/deleteComment/{fx["deletable_comment_ids"].pop()}', None, 'admin')),
+    'comments.import': (0.1, lambda rng, fx: ('POST', '/api/comment/import', _ndjson_comments(rng, fx), 'admin')),
+    'comments.export': (0.05, lambda rng, fx: ('GET', '/api/comment/export', None, 'admin')),
+    'auth.signin': (1, lambda rng, fx: ('POST', '/api/auth/signin', {'email': rng.choice(fx['emails']), 'password': BENCH_PASSWORD}, None)),
+    'auth.signup': (0.5, lambda rng, fx: ('POST', '/api/auth/signup', {'username': f'bench{uuid.uuid4().hex[:12]}', 'email': f'{uuid.uuid4().hex}@example.com', 'password': BENCH_PASSWORD}, None)),
+    'auth.google': (0.5, lambda rng, fx: ('POST', '/api/auth/google', {'email': rng.choice(fx['emails']), 'name': 'Bench User', 'googlePhotoUrl': 'https://example.com/p.png'}, None)),
+}
+
+
+def _request_parts(builder, rng, fx):
+    method, path, body, auth = builder(rng, fx)
+    headers = {}
+    if auth:
+        headers['Authorization'] = 'Bearer ' + rng.choice(fx[f'{auth}_tokens'])
+    if body is not None and not isinstance(body, bytes):
+        body = json.dumps(body).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    return method, path, body, headers
+
+
+def summarize(samples, elapsed):
+    # samples: (status, seconds, sql statements or None)
+    latencies = sorted(seconds for _, seconds, _ in samples)
+    sql = [count for _, _, count in samples if count is not None]
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 3)
+
+    summary = {
+        'count': len(samples),
+        'statuses': dict(sorted(Counter(str(status) for status, _, _ in samples).items())),
+        # Anything but a 2xx or 3xx, or no response at all, fails the run.
+        'errors': sum(1 for status, _, _ in samples if status is None or not 200 <= status < 400),
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else None,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+    }
+    if sql:
+        summary['sql_mean'] = round(sum(sql) / len(sql), 2)
+        summary['sql_max'] = max(sql)
+    return summary
+
+
+def run_in_process(app, fx):
+    # Every route REQUESTS_PER_ROUTE times through the test client, counting
+    # the SQL each request issues.
+    client = app.test_client()
+    rng = random.Random(1)
+    report = {}
+    # Requests must not run inside an outer app context, or they would share
+    # its session instead of getting a fresh one each.
+    with app.app_context():
+        engine = db.engine
+    for name, (_, builder) in ROUTES.items():
+        samples = []
+        started = time.perf_counter()
+        for _ in range(REQUESTS_PER_ROUTE):
+            try:
+                method, path, body, headers = _request_parts(builder, rng, fx)
+            except IndexError:
+                break
+            with QueryCounter(engine) as queries:
+                start = time.perf_counter()
+                response = client.open(path, method=method, data=body, headers=headers)
+                response.get_data()
+                seconds = time.perf_counter() - start
+            samples.append((response.status_code, seconds, queries.count))
+        if samples:
+            report[name] = summarize(samples, time.perf_counter() - started)
+    return report
+
+
+def _serve(database_url, workdir, ready):
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    # In a process group of its own, with the password hasher's pool, so
+    # that stopping the group stops both.
+    os.setpgrp()
+    server = make_server('127.0.0.1', 0, create_app(database_url, workdir), threaded=True)
+    ready.put(server.server_port)
+    server.serve_forever()
+
+
+def _http_worker(args):
+    base_url, fx, seed_value, deadline = args
+    rng = random.Random(seed_value)
+    names = list(ROUTES)
+    weights = [ROUTES[name][0] for name in names]
+    target = urlsplit(base_url)
+    conn = HTTPConnection(target.hostname, target.port, timeout=30)
+    samples = []
+    while time.time() < deadline:
+        name = rng.choices(names, weights)[0]
+        try:
+            method, path, body, headers = _request_parts(ROUTES[name][1], rng, fx)
+        except IndexError:
+            continue
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except OSError:
+            conn.close()
+            status = None
+        samples.append((name, status, time.perf_counter() - start))
+    conn.close()
+    return samples
+
+
+def run_http(base_url, fx):
+    # PROCESSES client processes send a weighted mix of requests for
+    # DURATION seconds.
+    deadline = time.time() + DURATION
+    started = time.perf_counter()
+    with multiprocessing.Pool(PROCESSES) as pool:
+        results = pool.map(_http_worker, [
+            (base_url, share_deletable(fx, seed_value + 1, PROCESSES + 1), seed_value, deadline) for seed_value in range(PROCESSES)
+        ])
+    elapsed = time.perf_counter() - started
+
+    by_route = defaultdict(list)
+    for samples in results:
+        for name, status, seconds in samples:
+            by_route[name].append((status, seconds, None))
+    everything = [sample for samples in by_route.values() for sample in samples]
+    return {
+        'url': base_url,
+        'processes': PROCESSES,
+        'seconds': DURATION,
+        'overall': summarize(everything, elapsed),
+        'routes': {name: summarize(by_route[name], elapsed) for name in ROUTES if by_route[name]},
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _print_table(title, routes):
+    print(f'\n{title}', file=sys.stderr)
+    print(f'{"route":22} {"n":>6} {"errors":>6} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"rps":>8} {"sql":>5}  statuses', file=sys.stderr)
+    for name, s in routes.items():
+        print(f'{name:22} {s["count"]:6} {s["errors"]:6} {s["p50_ms"]:9.2f} {s["p95_ms"]:9.2f} {s["p99_ms"]:9.2f} '
+              f'{s["throughput_rps"] or 0:8.1f} {s.get("sql_max", ""):>5}  {s["statuses"]}', file=sys.stderr)
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    database_url = DATABASE_URL or f'sqlite:///{os.path.join(workdir, "bench.db")}'
+    app = create_app(database_url, workdir)
+    with app.app_context():
+        if DATABASE_URL:
+            dataset = {'database': 'existing'}
+        else:
+            db.create_all()
+            started = time.perf_counter()
+            dataset = seed(SCALE)
+            dataset['seed_seconds'] = round(time.perf_counter() - started, 1)
+            print(f'Seeded {dataset}', file=sys.stderr)
+        fx = load_fixture()
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+    report = {
+        'meta': {
+            'revision': _git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'requests_per_route': REQUESTS_PER_ROUTE,
+        },
+        'dataset': dataset,
+        'in_process': run_in_process(app, share_deletable(fx, 0, PROCESSES + 1)),
+    }
+    _print_table('In process (test client)', report['in_process'])
+
+    server = None
+    base_url = TARGET_URL
+    try:
+        if not base_url:
+            # Not a daemon: daemonic processes cannot start the password
+            # hasher's pool, so every sign-in would fail.
+            ready = multiprocessing.Queue()
+            server = multiprocessing.Process(target=_serve, args=(database_url, workdir, ready))
+            server.start()
+            base_url = f'http://127.0.0.1:{ready.get(timeout=30)}'
+        report['http'] = run_http(base_url, fx)
+    finally:
+        if server is not None:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.join()
+    _print_table(f'HTTP, {PROCESSES} processes for {DURATION:g}s', report['http']['routes'])
+    overall = report['http']['overall']
+    print(f'overall: {overall["count"]} requests, {overall["throughput_rps"]} req/s, '
+          f'p50 {overall["p50_ms"]} ms, p99 {overall["p99_ms"]} ms', file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if OUTPUT:
+        with open(OUTPUT, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    # The timings of a run with failed requests are not comparable to
+    # anything, so the run fails.
+    failed = {
+        f'{phase} {name}': s['errors']
+        for phase, routes in (('in process', report['in_process']), ('http', report['http']['routes']))
+        for name, s in routes.items() if s['errors']
+    }
+    if failed:
+        for name, errors in failed.items():
+            print(f'FAIL {name}: {errors} requests without a 2xx or 3xx response', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
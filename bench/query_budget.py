@@ -0,0 +1,104 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from flask import Flask
+from models import db, User, Post, Comment, CommentLike
+from controllers.user_controller import user_routes
+from controllers.post_controller import post_routes
+from controllers.comment_controller import comment_routes
+from utils.query_counter import QueryCounter
+from utils.threads import reply_path
+from utils.facets import rebuild_facets
+
+# Maximum SQL statements per request. Every case is run at several page sizes
+# and must also issue the same number of statements at each of them.
+BUDGETS = {
+    '/api/post/getposts?limit={limit}': 1,
+    '/api/post/getposts?limit={limit}&order=desc&sortBy=updated_at': 1,
+    '/api/post/getposts?limit={limit}&category=tech': 2,
+    '/api/post/getposts?limit={limit}&userId=1&cursor=': 2,
+    '/api/post/getposts?limit={limit}&sort=top&cursor=': 1,
+    # Served from the slug cache after the warm-up request.
+    '/api/post/getpost/post-1': 0,
+    '/api/post/facets?limit={limit}': 3,
+    '/api/post/facets?limit={limit}&searchTerm=lorem': 2,
+    '/api/comment/getPostComments/1': 1,
+    '/api/comment/getPostComments/1?sort=hot&limit={limit}': 1,
+    '/api/comment/getPostThreads/1?limit={limit}&replies=3': 3,
+    '/api/comment/getReplies/1?limit={limit}': 3,
+    '/api/comment/getReplies/1?branch=1&limit={limit}': 3,
+}
+PAGE_SIZES = (5, 50)
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['JWT_SECRET'] = 'bench-secret-bench-secret-bench-secret'
+    db.init_app(app)
+    app.register_blueprint(user_routes, url_prefix='/api/user')
+    app.register_blueprint(post_routes, url_prefix='/api/post')
+    app.register_blueprint(comment_routes, url_prefix='/api/comment')
+    return app
+
+
+def seed():
+    users = [User(username=f'user{i}', email=f'user{i}@example.com', password_hash='x') for i in range(20)]
+    db.session.add_all(users)
+    db.session.flush()
+    for i in range(100):
+        post = Post(
+            user_id=users[i % 20].id, title=f'Post {i}', content='Lorem ipsum ' * 20,
+            category='tech' if i % 2 else 'life', slug=f'post-{i}',
+        )
+        db.session.add(post)
+        db.session.flush()
+        comments = []
+        for j in range(60 if i == 0 else 3):
+            likers = users[:j % 7]
+            # Threads of three: a comment, a reply and a reply to the reply.
+            parent_id, path = reply_path(post.id, comments[-1].id if j % 3 else None)
+            comment = Comment(
+                content=f'Comment {j}', post_id=post.id, user_id=users[j % 20].id, number_of_likes=len(likers),
+                parent_id=parent_id, path=path,
+            )
+            comment.like_rows = [CommentLike(user_id=user.id) for user in likers]
+            db.session.add(comment)
+            db.session.flush()
+            comments.append(comment)
+    db.session.commit()
+    rebuild_facets()
+
+
+def main():
+    app = create_app()
+    client = app.test_client()
+    failures = []
+    with app.app_context():
+        db.create_all()
+        seed()
+        for template, budget in BUDGETS.items():
+            counts = []
+            for limit in PAGE_SIZES:
+                url = template.format(limit=limit)
+                client.get(url)  # warm caches that are filled once per process
+                with QueryCounter(db.engine) as queries:
+                    response = client.get(url)
+                if response.status_code != 200:
+                    failures.append(f'{url}: HTTP {response.status_code}')
+                counts.append(queries.count)
+            status = 'ok'
+            if max(counts) > budget or len(set(counts)) > 1:
+                status = 'FAIL'
+                failures.append(f'{template}: {counts} statements, budget {budget}')
+            print(f'{status:4} {template:65} {counts}')
+
+    if failures:
+        print('\n'.join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
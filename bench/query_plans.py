@@ -0,0 +1,102 @@
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from query_budget import create_app, seed
+from models import db, User
+from utils.auth import issue_token
+from utils.query_counter import QueryCounter
+
+# Endpoints whose SQL must be answered from indexes. Cases marked
+# allow_sort may use a temporary b-tree for ORDER BY, for orderings no
+# index can provide such as full-text relevance.
+CASES = [
+    ('/api/post/getposts?limit=9', False),
+    ('/api/post/getposts?limit=9&order=desc', False),
+    ('/api/post/getposts?limit=9&order=desc&sortBy=updated_at', False),
+    ('/api/post/getposts?limit=9&userId=3', False),
+    ('/api/post/getposts?limit=9&category=tech&order=desc', False),
+    ('/api/post/getposts?limit=9&postId=5', False),
+    ('/api/post/getposts?limit=9&cursor=&order=desc', False),
+    ('/api/post/getposts?limit=9&searchTerm=lorem', True),
+    ('/api/post/getposts?limit=9&sort=hot&cursor=', False),
+    ('/api/post/getposts?limit=9&sort=top&cursor=', False),
+    ('/api/post/facets', False),
+    ('/api/comment/getPostComments/1', False),
+    ('/api/comment/getPostComments/1?sort=hot', False),
+    ('/api/comment/getPostComments/1?sort=top', False),
+    ('/api/comment/getPostThreads/1?limit=9&replies=3', False),
+    ('/api/comment/getReplies/1?limit=9', False),
+    ('/api/comment/getReplies/1?branch=1', False),
+    ('/api/comment/getcomments?limit=9&sort=desc', False),
+    ('/api/comment/getcomments?limit=9&cursor=', False),
+    ('/api/user/getusers?limit=9', False),
+    ('/api/user/getusers?limit=9&cursor=', False),
+]
+
+# Indexes a case's plans must use, beyond not scanning or sorting.
+REQUIRED_INDEXES = {
+    '/api/user/getusers?limit=9': 'ix_users_created_at_id',
+    '/api/user/getusers?limit=9&cursor=': 'ix_users_created_at_id',
+}
+
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)$')
+TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+
+def query_plan(statement, parameters):
+    if not statement.lstrip().upper().startswith('SELECT'):
+        return []
+    rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    return [row[-1] for row in rows]
+
+
+def plan_problems(details, allow_sort):
+    problems = []
+    for detail in details:
+        if FULL_SCAN_RE.match(detail):
+            problems.append(detail)
+        elif detail == TEMP_SORT and not allow_sort:
+            problems.append(detail)
+    return problems
+
+
+def main():
+    app = create_app()
+    client = app.test_client()
+    failures = []
+    with app.app_context():
+        db.create_all()
+        seed()
+        admin = db.session.get(User, 1)
+        admin.is_admin = True
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {issue_token(admin)}'}
+
+        for url, allow_sort in CASES:
+            client.get(url, headers=headers)  # warm caches that are filled once per process
+            with QueryCounter(db.engine) as queries:
+                response = client.get(url, headers=headers)
+            if response.status_code != 200:
+                failures.append(f'{url}: HTTP {response.status_code}')
+                continue
+            details = []
+            for statement, parameters in zip(queries.statements, queries.parameters):
+                details.extend(query_plan(statement, parameters))
+            problems = plan_problems(details, allow_sort)
+            index = REQUIRED_INDEXES.get(url)
+            if index and not any(f'USING INDEX {index}' in detail or f'USING COVERING INDEX {index}' in detail for detail in details):
+                problems.append(f'does not use {index}')
+            print(f'{"FAIL" if problems else "ok":4} {url} {problems or ""}')
+            if problems:
+                failures.append(f'{url}: {", ".join(problems)}')
+
+    if failures:
+        print('\n'.join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
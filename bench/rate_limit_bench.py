@@ -0,0 +1,62 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from flask import Flask
+from utils.rate_limit import RateLimiter
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', 200000))
+THREADS = int(os.environ.get('BENCH_THREADS', 8))
+CLIENTS = int(os.environ.get('BENCH_CLIENTS', 10000))
+
+
+def take_ns(limiter, iterations, offset=0):
+    clients = [f'ip:10.0.{i // 256}.{i % 256}' for i in range(CLIENTS)]
+    start = time.perf_counter()
+    for i in range(iterations):
+        limiter.take('read', clients[(i + offset) % CLIENTS])
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def request_us(app, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with app.test_request_context('/api/post/getposts?limit=9', environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+            app.preprocess_request()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    limiter = RateLimiter(limits={'read': (1e9, 1e9)})
+    single = take_ns(limiter, ITERATIONS)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda n=n: results.append(take_ns(limiter, ITERATIONS // THREADS, n * 997)))
+        for n in range(THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    bare = Flask(__name__)
+    bare.config['JWT_SECRET'] = 'bench-secret'
+    limited = Flask(__name__)
+    limited.config['JWT_SECRET'] = 'bench-secret'
+    limited.config['RATE_LIMIT_ENABLED'] = True
+    limited.config['RATE_LIMITS'] = {'read': (1e9, 1e9)}
+    RateLimiter().init_app(limited)
+    iterations = ITERATIONS // 10
+    overhead = request_us(limited, iterations) - request_us(bare, iterations)
+
+    print(f'take(), one thread          {single:8.0f} ns')
+    print(f'take(), {THREADS} threads          {sum(results) / len(results):8.0f} ns per call per thread')
+    print(f'before_request overhead     {overhead:8.2f} us/request')
+
+
+if __name__ == '__main__':
+    main()
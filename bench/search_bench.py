@@ -0,0 +1,84 @@
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from utils.search import POSTS_FTS_DDL, POSTS_FTS_QUERY, build_match_query
+
+WORDS = [
+    'python', 'flask', 'react', 'database', 'index', 'search', 'cache', 'query',
+    'design', 'travel', 'recipe', 'garden', 'music', 'coffee', 'startup', 'writing',
+    'javascript', 'sqlite', 'deploy', 'server', 'cloud', 'mobile', 'health', 'money',
+]
+SEARCHES = ['pyth', 'flask', 'react hooks', 'sqlite index', 'coff', 'cloud deploy']
+
+
+def vocabulary(rng, size=20000):
+    # Zipf-like word frequencies so search terms are selective, as in real text.
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = [''.join(rng.choices(letters, k=rng.randint(4, 9))) for _ in range(size)]
+    words[100:100] = WORDS
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    return words, weights
+
+
+def seed(conn, count):
+    conn.execute(
+        'CREATE TABLE posts (id INTEGER PRIMARY KEY, title TEXT NOT NULL, content TEXT NOT NULL)'
+    )
+    for statement in POSTS_FTS_DDL:
+        conn.execute(statement)
+
+    rng = random.Random(42)
+    words, weights = vocabulary(rng)
+    batch = []
+    for i in range(count):
+        title = ' '.join(rng.choices(words, weights, k=5)) + f' {i}'
+        content = ' '.join(rng.choices(words, weights, k=120))
+        batch.append((title, content))
+        if len(batch) == 10000:
+            conn.executemany('INSERT INTO posts (title, content) VALUES (?, ?)', batch)
+            batch = []
+    if batch:
+        conn.executemany('INSERT INTO posts (title, content) VALUES (?, ?)', batch)
+    conn.commit()
+
+
+def timed(conn, sql, params, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(sql, params).fetchall()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run(count, repeat=5):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        seed(conn, count)
+
+        like_sql = (
+            'SELECT id FROM posts WHERE title LIKE :pattern OR content LIKE :pattern '
+            'ORDER BY id DESC LIMIT 9'
+        )
+        fts_sql = (
+            'SELECT posts.id FROM posts JOIN (' + POSTS_FTS_QUERY + ') AS m '
+            'ON m.post_id = posts.id ORDER BY m.rank LIMIT 9'
+        )
+
+        like_ms = fts_ms = 0.0
+        for term in SEARCHES:
+            like_ms += timed(conn, like_sql, {'pattern': f'%{term}%'}, repeat)
+            fts_ms += timed(conn, fts_sql, {'match': build_match_query(term)}, repeat)
+        conn.close()
+
+    print(f'{count:>9} posts  LIKE {like_ms / len(SEARCHES):9.2f} ms  FTS5 {fts_ms / len(SEARCHES):9.2f} ms')
+
+
+if __name__ == '__main__':
+    scales = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    for scale in scales:
+        run(scale)
@@ -0,0 +1,181 @@
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from faker import Faker
+from models import db, User, Post, Comment, CommentLike, COMMENT_PATH_DIGITS, COMMENT_MAX_DEPTH
+from utils.passwords import password_hasher
+from utils.stats import stats
+from utils.cache import response_cache
+from utils.ranking import refresh_posts
+from utils.facets import rebuild_facets
+
+# Every seeded user signs in with this password.
+BENCH_PASSWORD = 'bench-password'
+
+SCALES = {
+    'tiny': {'users': 50, 'posts': 200, 'comments': 2000},
+    'small': {'users': 500, 'posts': 2000, 'comments': 20000},
+    'medium': {'users': 5000, 'posts': 20000, 'comments': 200000},
+    'large': {'users': 50000, 'posts': 200000, 'comments': 2000000},
+}
+CATEGORIES = ['uncategorized', 'javascript', 'reactjs', 'nextjs', 'python', 'flask', 'databases', 'devops']
+ADMINS = 5
+BATCH_SIZE = 5000
+# The share of comments that reply to an earlier comment on the same post,
+# and how many of each post's latest comments a reply may pick from.
+REPLY_SHARE = 0.4
+RECENT_PARENTS = 50
+# Faker is slow per call, so text is drawn from pools generated up front.
+TEXT_POOL_SIZE = 2000
+
+
+def _pareto_weights(rng, n, alpha):
+    return [rng.paretovariate(alpha) for _ in range(n)]
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(db.insert(model), rows[start:start + BATCH_SIZE])
+
+
+def seed(scale='small', seed_value=1234, days=365):
+    # Fills the database with a reproducible dataset: a few admins, authors
+    # whose post counts and posts whose comment counts follow a long tail,
+    # comments threaded into reply trees, and likes concentrated on a
+    # minority of comments. Returns the ids the load generator needs.
+    # Tables must exist and be empty.
+    sizes = SCALES[scale]
+    fake = Faker()
+    Faker.seed(seed_value)
+    rng = random.Random(seed_value)
+    now = datetime.utcnow().replace(microsecond=0)
+
+    def created():
+        return now - timedelta(seconds=rng.randrange(days * 24 * 3600))
+
+    sentences = [fake.sentence(nb_words=10) for _ in range(TEXT_POOL_SIZE)]
+    paragraphs = [fake.paragraph(nb_sentences=8) for _ in range(TEXT_POOL_SIZE // 4)]
+    password_hash = password_hasher.hash(BENCH_PASSWORD)
+
+    users = []
+    for i in range(sizes['users']):
+        at = created()
+        users.append({
+            'id': i + 1,
+            'username': f'{fake.user_name()}{i}',
+            'email': f'user{i}@{fake.free_email_domain()}',
+            'password_hash': password_hash,
+            'is_admin': i < ADMINS,
+            'created_at': at,
+            'updated_at': at,
+        })
+    _insert(User, users)
+
+    author_weights = _pareto_weights(rng, sizes['users'], 1.2)
+    authors = rng.choices(range(1, sizes['users'] + 1), weights=author_weights, k=sizes['posts'])
+    posts = []
+    for i, author in enumerate(authors):
+        at = created()
+        title = f'{fake.sentence(nb_words=6).rstrip(".")} {i}'
+        posts.append({
+            'id': i + 1,
+            'user_id': author,
+            'title': title,
+            'content': '\n\n'.join(rng.sample(paragraphs, 4)),
+            'category': rng.choice(CATEGORIES),
+            'slug': f'post-{i + 1}',
+            'created_at': at,
+            'updated_at': at,
+        })
+    _insert(Post, posts)
+    post_created = {post['id']: post['created_at'] for post in posts}
+    del posts
+
+    post_weights = _pareto_weights(rng, sizes['posts'], 1.1)
+    commenter_weights = _pareto_weights(rng, sizes['users'], 1.5)
+    comment_posts = rng.choices(range(1, sizes['posts'] + 1), weights=post_weights, k=sizes['comments'])
+    commenters = rng.choices(range(1, sizes['users'] + 1), weights=commenter_weights, k=sizes['comments'])
+    comments = []
+    likes = []
+    # The most recent comments on each post, as (id, path, created_at, depth),
+    # for replies to pick a parent from.
+    recent = {}
+    for i, (post_id, user_id) in enumerate(zip(comment_posts, commenters)):
+        comment_id = i + 1
+        at = post_created[post_id] + timedelta(seconds=rng.randrange(30 * 24 * 3600))
+        parent_id, path = None, ''
+        candidates = recent.setdefault(post_id, [])
+        if candidates and rng.random() < REPLY_SHARE:
+            parent_id, parent_path, parent_at, depth = rng.choice(candidates)
+            if depth + 1 < COMMENT_MAX_DEPTH:
+                path = parent_path + str(parent_id).zfill(COMMENT_PATH_DIGITS)
+                at = parent_at + timedelta(seconds=rng.randrange(3 * 24 * 3600))
+            else:
+                parent_id = None
+        at = min(at, now)
+        candidates.append((comment_id, path, at, len(path) // COMMENT_PATH_DIGITS))
+        if len(candidates) > RECENT_PARENTS:
+            candidates.pop(0)
+        # Most comments get a like or two; a few collect hundreds.
+        like_count = min(int(rng.paretovariate(1.6)) - 1, sizes['users'])
+        likers = rng.sample(range(1, sizes['users'] + 1), like_count) if like_count else []
+        comments.append({
+            'id': comment_id,
+            'post_id': post_id,
+            'user_id': user_id,
+            'parent_id': parent_id,
+            'path': path,
+            'content': rng.choice(sentences),
+            'number_of_likes': len(likers),
+            'created_at': at,
+            'updated_at': at,
+        })
+        likes.extend({'comment_id': comment_id, 'user_id': liker, 'created_at': at} for liker in likers)
+        if len(comments) >= BATCH_SIZE:
+            _insert(Comment, comments)
+            _insert(CommentLike, likes)
+            comments, likes = [], []
+    _insert(Comment, comments)
+    _insert(CommentLike, likes)
+    refresh_posts(range(1, sizes['posts'] + 1))
+    db.session.commit()
+    rebuild_facets()
+
+    # Core inserts bypass the session events that keep these current.
+    stats.invalidate()
+    response_cache.invalidate('posts', 'comments')
+    like_total = db.session.scalar(db.select(db.func.count()).select_from(CommentLike))
+    return {
+        'scale': scale,
+        'seed': seed_value,
+        'users': sizes['users'],
+        'admins': ADMINS,
+        'posts': sizes['posts'],
+        'comments': sizes['comments'],
+        'likes': like_total,
+    }
+
+
+def main():
+    from flask import Flask
+    from config import DATABASE_URL, engine_options
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(DATABASE_URL)
+    db.init_app(app)
+    scale = os.environ.get('BENCH_SCALE', 'small')
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        summary = seed(scale, int(os.environ.get('BENCH_SEED', 1234)))
+        print(f'Seeded {DATABASE_URL} in {time.perf_counter() - start:.1f}s: {summary}')
+
+
+if __name__ == '__main__':
+    main()
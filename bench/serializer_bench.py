@@ -0,0 +1,67 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from sqlalchemy.orm import selectinload
+from sqlalchemy_serializer import SerializerMixin
+from models import db, Post, Comment
+from load_suite import create_app
+from seed_data import seed
+from utils.serializers import post_schema, comment_schema
+
+SCALE = os.environ.get('BENCH_SCALE', 'small')
+PAGE_SIZES = [int(n) for n in os.environ.get('BENCH_PAGE_SIZES', '9,100,1000').split(',')]
+# Rows serialized per page size and approach; pages repeat until reached.
+ROWS = int(os.environ.get('BENCH_ROWS', 20000))
+
+
+def with_to_dict(model, fields):
+    # The SerializerMixin the models used to inherit, limited to the fields
+    # the schemas send so every approach does the same work.
+    model.__bases__ = (*model.__bases__, SerializerMixin)
+    model.serialize_only = fields
+
+
+def rows_per_second(load, limit):
+    pages = max(1, ROWS // limit)
+    start = time.perf_counter()
+    for _ in range(pages):
+        serialized = load(limit)
+        db.session.expunge_all()
+    return pages * len(serialized) / (time.perf_counter() - start)
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    app = create_app(f'sqlite:///{os.path.join(workdir, "bench.db")}', workdir)
+    with_to_dict(Post, post_schema.fields)
+    with_to_dict(Comment, comment_schema.fields + ('likes',))
+    cases = {
+        'posts': (
+            lambda limit: [post.to_dict() for post in db.session.scalars(db.select(Post).limit(limit))],
+            lambda limit: post_schema.dump_rows(db.session.execute(post_schema.select().limit(limit))),
+        ),
+        'comments': (
+            lambda limit: [
+                comment.to_dict()
+                for comment in db.session.scalars(db.select(Comment).options(selectinload(Comment.like_rows)).limit(limit))
+            ],
+            lambda limit: comment_schema.dump_rows(db.session.execute(comment_schema.select().limit(limit))),
+        ),
+    }
+    with app.app_context():
+        db.create_all()
+        print(f'Seeded {seed(SCALE)}', file=sys.stderr)
+        print(f'{"":9} {"rows":>5} {"to_dict() rows/s":>17} {"schema rows/s":>14} {"speedup":>8}')
+        for name, (to_dict, schema) in cases.items():
+            for limit in PAGE_SIZES:
+                before = rows_per_second(to_dict, limit)
+                after = rows_per_second(schema, limit)
+                print(f'{name:9} {limit:5} {before:17.0f} {after:14.0f} {after / before:7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
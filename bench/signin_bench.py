@@ -0,0 +1,86 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from models import db, User
+from load_suite import create_app
+from seed_data import seed, BENCH_PASSWORD
+from utils.passwords import password_hasher
+
+SIGNIN_THREADS = int(os.environ.get('BENCH_SIGNIN_THREADS', 16))
+DURATION = float(os.environ.get('BENCH_SECONDS', 5))
+
+
+def run(label, app, emails, **config):
+    # POSTs to /api/auth/signin from SIGNIN_THREADS clients while one more
+    # reads the first page of posts, so a slow hasher shows up in the
+    # latency of requests that never touch it.
+    app.config.update(config)
+    password_hasher.init_app(app)
+    stop = threading.Event()
+    signins = []
+    rejected = []
+    failed = []
+    read_latencies = []
+
+    def signin_worker(index):
+        client = app.test_client()
+        done = busy = errors = 0
+        while not stop.is_set():
+            email = emails[(index + done + busy) % len(emails)]
+            response = client.post('/api/auth/signin', json={'email': email, 'password': BENCH_PASSWORD})
+            if response.status_code == 200:
+                done += 1
+            elif response.status_code == 503:
+                busy += 1
+                time.sleep(0.01)
+            else:
+                errors += 1
+        signins.append(done)
+        rejected.append(busy)
+        failed.append(errors)
+
+    def read_worker():
+        client = app.test_client()
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.get('/api/post/getposts?limit=9')
+            read_latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=signin_worker, args=(i,)) for i in range(SIGNIN_THREADS)]
+    threads.append(threading.Thread(target=read_worker))
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    read_latencies.sort()
+    p99 = read_latencies[int(len(read_latencies) * 0.99)] * 1000 if read_latencies else 0
+    print(f'{label:14} signins {sum(signins) / DURATION:7.1f}/s  rejected {sum(rejected):6}  failed {sum(failed):4}  '
+          f'reads {len(read_latencies) / DURATION:6.0f}/s  read p99 {p99:7.2f} ms')
+    return sum(failed)
+
+
+def main():
+    workers = os.cpu_count() or 2
+    with tempfile.TemporaryDirectory() as workdir:
+        app = create_app(f'sqlite:///{os.path.join(workdir, "bench.db")}', workdir)
+        with app.app_context():
+            db.create_all()
+            seed('tiny')
+            emails = db.session.scalars(db.select(User.email)).all()
+        failed = run('inline', app, emails, PASSWORD_HASH_WORKERS=0, PASSWORD_HASH_QUEUE_DEPTH=SIGNIN_THREADS)
+        failed += run(f'pool x{workers}', app, emails, PASSWORD_HASH_WORKERS=workers, PASSWORD_HASH_QUEUE_DEPTH=SIGNIN_THREADS)
+        failed += run(f'pool x{workers} q4', app, emails, PASSWORD_HASH_WORKERS=workers, PASSWORD_HASH_QUEUE_DEPTH=4)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
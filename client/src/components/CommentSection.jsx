@@ -10,6 +10,7 @@ export default function CommentSection({ postId }) {
   const [comment, setComment] = useState('');
   const [commentError, setCommentError] = useState(null);
   const [comments, setComments] = useState([]);
+  const [authors, setAuthors] = useState({});
   const [showModal, setShowModal] = useState(false);
   const [commentToDelete, setCommentToDelete] = useState(null);
   const navigate = useNavigate();
@@ -56,6 +57,39 @@ export default function CommentSection({ postId }) {
     getComments();
   }, [postId]);
 
+  useEffect(() => {
+    // Every author not loaded yet, up to 100 to a request.
+    const missing = [
+      ...new Set(comments.map((comment) => comment.userId)),
+    ].filter((userId) => !(userId in authors));
+    if (missing.length === 0) {
+      return;
+    }
+    const getAuthors = async () => {
+      try {
+        const loaded = {};
+        for (let i = 0; i < missing.length; i += 100) {
+          const ids = missing.slice(i, i + 100);
+          const res = await fetch(`/api/user/profiles?ids=${ids.join(',')}`);
+          if (res.ok) {
+            const data = await res.json();
+            // Deleted users come back missing; don't ask for them again.
+            ids.forEach((userId) => {
+              loaded[userId] = {};
+            });
+            data.users.forEach((user) => {
+              loaded[user._id] = user;
+            });
+          }
+        }
+        setAuthors((previous) => ({ ...previous, ...loaded }));
+      } catch (error) {
+        console.log(error.message);
+      }
+    };
+    getAuthors();
+  }, [comments]);
+
   const handleLike = async (commentId) => {
     try {
       if (!currentUser) {
@@ -176,6 +210,7 @@ export default function CommentSection({ postId }) {
             <Comment
               key={comment._id}
               comment={comment}
+              user={authors[comment.userId]}
               onLike={handleLike}
               onEdit={handleEdit}
               onDelete={(commentId) => {
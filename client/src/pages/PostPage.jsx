@@ -16,7 +16,7 @@ export default function PostPage() {
     const fetchPost = async () => {
       try {
         setLoading(true);
-        const res = await fetch(`/api/post/getposts?slug=${postSlug}`);
+        const res = await fetch(`/api/post/getpost/${encodeURIComponent(postSlug)}`);
         const data = await res.json();
         if (!res.ok) {
           setError(true);
@@ -24,7 +24,7 @@ export default function PostPage() {
           return;
         }
         if (res.ok) {
-          setPost(data.posts[0]);
+          setPost(data);
           setLoading(false);
           setError(false);
         }